@@ -0,0 +1,48 @@
+"""
+Benchmark of the Newton fractal engines.
+Times the dense and the active-set engine of Newton_fractals.compute for a range of
+resolutions and polynomial degrees, and checks that both engines give identical output.
+
+Run from the repository root:
+    python -m benchmarks.newton_active_set
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from motives.newton_fractals import Newton_fractals
+
+
+def time_engine(nf: Newton_fractals, engine: str):
+    """
+    :param nf: Newton_fractals | The fractal to compute
+    :param engine: str | Engine passed to Newton_fractals.compute
+    :return: tuple (wall time in seconds, basin, iterations)
+    """
+    start = time.perf_counter()
+    nf.compute(engine=engine, cache=False)
+    return time.perf_counter() - start, nf.basin, nf.iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--resolutions', type=int, nargs='+', default=[250, 500, 1000, 2000])
+    parser.add_argument('--degrees', type=int, nargs='+', default=[3, 5, 8])
+    parser.add_argument('--max-iter', type=int, default=50)
+    args = parser.parse_args()
+
+    print(f'{"degree":>6} {"resolution":>10} {"dense [s]":>10} {"active [s]":>10} {"speedup":>8} {"identical":>9}')
+    for degree in args.degrees:
+        for resolution in args.resolutions:
+            nf = Newton_fractals(polynomial_degree=degree, resolution=resolution, max_basins_iter=args.max_iter)
+            t_dense, basin_dense, iter_dense = time_engine(nf, 'dense')
+            t_active, basin_active, iter_active = time_engine(nf, 'active')
+            identical = np.array_equal(basin_dense, basin_active) and np.array_equal(iter_dense, iter_active)
+            print(f'{degree:>6} {resolution:>10} {t_dense:>10.3f} {t_active:>10.3f} '
+                  f'{t_dense / t_active:>7.1f}x {str(identical):>9}')
+
+
+if __name__ == '__main__':
+    main()
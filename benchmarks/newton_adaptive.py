@@ -0,0 +1,57 @@
+"""
+Accuracy and speed of the adaptive boundary-only Newton renderer.
+Compares Newton_fractals.compute_adaptive with the brute-force Newton_fractals.compute at each
+resolution and reports the speedup together with the basin and iteration errors.
+The default resolutions need a machine with enough memory for a 10^8 pixel brute-force render.
+
+Run from the repository root:
+    python -m benchmarks.newton_adaptive
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from motives.newton_fractals import Newton_fractals
+
+
+def accuracy_report(basin, iterations, ref_basin, ref_iterations):
+    """
+    :return: dict comparing an approximate render against the brute-force one
+    """
+    iteration_error = np.abs(iterations - ref_iterations)
+    return {'basin_mismatch': float(np.mean(basin != ref_basin)),
+            'iterations_mismatch': float(np.mean(iteration_error > 0)),
+            'iterations_mean_abs_error': float(np.mean(iteration_error)),
+            'iterations_max_abs_error': int(iteration_error.max())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--resolutions', type=int, nargs='+', default=[4000, 10000])
+    parser.add_argument('--degree', type=int, default=3)
+    parser.add_argument('--coarse-step', type=int, default=8)
+    args = parser.parse_args()
+
+    for resolution in args.resolutions:
+        nf = Newton_fractals(polynomial_degree=args.degree, resolution=resolution)
+
+        start = time.perf_counter()
+        nf.compute(cache=False)
+        t_brute = time.perf_counter() - start
+        ref_basin, ref_iterations = nf.basin, nf.iterations
+
+        start = time.perf_counter()
+        nf.compute_adaptive(coarse_step=args.coarse_step)
+        t_adaptive = time.perf_counter() - start
+
+        report = accuracy_report(nf.basin, nf.iterations, ref_basin, ref_iterations)
+        print(f'resolution {resolution}: brute force {t_brute:.2f} s, adaptive {t_adaptive:.2f} s, '
+              f'speedup {t_brute / t_adaptive:.1f}x')
+        for key, value in report.items():
+            print(f'    {key}: {value:.3g}')
+
+
+if __name__ == '__main__':
+    main()
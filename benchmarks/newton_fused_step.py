@@ -0,0 +1,68 @@
+"""
+Benchmark of a single Newton step for z^n - 1.
+Compares the generic step Z - f(Z) / df(Z) with the fused in-place Newton_fractals.newton_step,
+reporting the time per iteration and the memory allocated by numpy during one step (tracemalloc).
+
+Run from the repository root:
+    python -m benchmarks.newton_fused_step
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from motives.newton_fractals import Newton_fractals
+
+
+def generic_step(nf: Newton_fractals, Z, buffers):
+    return Z - nf.f(Z) / nf.df(Z)
+
+
+def fused_step(nf: Newton_fractals, Z, buffers):
+    out, power, step = buffers
+    return nf.newton_step(Z, out, (power, step))
+
+
+def measure(step, nf: Newton_fractals, Z, buffers, repeats: int):
+    """
+    :return: tuple (seconds per step, peak bytes allocated within one step)
+    """
+    step(nf, Z, buffers)  # warm up
+
+    tracemalloc.start()
+    step(nf, Z, buffers)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        step(nf, Z, buffers)
+    return (time.perf_counter() - start) / repeats, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--resolutions', type=int, nargs='+', default=[500, 1000, 2000])
+    parser.add_argument('--degrees', type=int, nargs='+', default=[3, 5, 8])
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f'{"degree":>6} {"resolution":>10} {"generic [ms]":>12} {"fused [ms]":>10} '
+          f'{"generic [MB]":>12} {"fused [MB]":>10}')
+    for degree in args.degrees:
+        for resolution in args.resolutions:
+            nf = Newton_fractals(polynomial_degree=degree, resolution=resolution)
+            X, Y = np.meshgrid(nf.x, nf.y)
+            Z = (X + 1j * Y).ravel()
+            buffers = tuple(np.empty_like(Z) for _ in range(3))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                t_generic, mem_generic = measure(generic_step, nf, Z, buffers, args.repeats)
+                t_fused, mem_fused = measure(fused_step, nf, Z, buffers, args.repeats)
+            print(f'{degree:>6} {resolution:>10} {t_generic * 1e3:>12.1f} {t_fused * 1e3:>10.1f} '
+                  f'{mem_generic / 2 ** 20:>12.1f} {mem_fused / 2 ** 20:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
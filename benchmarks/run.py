@@ -0,0 +1,286 @@
+"""
+Benchmark suite over the hot paths of every motive and of the poster builder.
+Every case runs in a fresh subprocess, so its peak RSS is measured on its own and imports or caches of other
+cases do not leak into it. Wall time, peak RSS and throughput are appended to a JSON Lines history, and
+compared with a stored baseline: a case that is slower or larger than the baseline by more than the tolerance
+is flagged as a regression. The run exits with status 1 when a case regressed or failed.
+Caches are bypassed, the cases always measure computation.
+
+Run from the repository root:
+    python -m benchmarks.run                        # quick suite
+    python -m benchmarks.run --suite full           # Newton up to 4000 px, chaos game up to 10^8 points, ...
+    python -m benchmarks.run --cases newton         # cases whose name contains 'newton'
+    python -m benchmarks.run --save-baseline        # store this run as the baseline of this machine
+    python -m benchmarks.run --profile chaos_game/n=1000000
+The poster cases use the fonts of make_poster.DEFAULT_SPEC, set MATHART_BENCH_FONT to use another font file.
+"""
+
+import argparse
+import cProfile
+import datetime
+import json
+import os
+import platform
+import pstats
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+HISTORY = os.path.join(RESULTS_DIR, 'history.jsonl')
+BASELINE = os.path.join(RESULTS_DIR, 'baseline.json')
+
+
+# %% cases, each returns (seconds of the timed section, amount of work done in it)
+
+def newton(degree: int, resolution: int):
+    from motives.newton_fractals import Newton_fractals
+
+    nf = Newton_fractals(polynomial_degree=degree, resolution=resolution)
+    start = time.perf_counter()
+    nf.compute(cache=False)
+    return time.perf_counter() - start, resolution ** 2
+
+
+def chaos_game(n: int, size_px: int = 2000):
+    from motives.sierpinski_triangle import Point, Sierpinski
+
+    st = Sierpinski(Point(1, 1), Point(2, np.sqrt(3)), Point(3, 1), seed=0)
+    start = time.perf_counter()
+    st.accumulate(n, size_px, size_px, progress=False, cache=False)
+    return time.perf_counter() - start, n
+
+
+def fibonacci_circle(n: int, size_px: int = 2000):
+    from motives.fibonacci_circle import get_circle_position, mapped_sequence, render_chords
+
+    start = time.perf_counter()
+    values, ticks = mapped_sequence('fibonacci', 'leading_digits', n, cache=False, digits=3)
+    xs, ys = get_circle_position(values, max_num=ticks)
+    render_chords(xs, ys, size_px=size_px)
+    return time.perf_counter() - start, n
+
+
+def brownian_motion(n_walks: int, size_px: int = 1000):
+    from motives.brownian_motion import Brownian_motion
+
+    bm = Brownian_motion(p_up=0.52, seed=0)
+    start = time.perf_counter()
+    bm.density(n_walks, size_px, size_px, progress=False)
+    return time.perf_counter() - start, n_walks
+
+
+def poster(dpi: int, streamed: bool = False):
+    from PIL import Image
+
+    import make_poster
+
+    with tempfile.TemporaryDirectory() as directory:
+        figure = os.path.join(directory, 'figure.png')
+        Image.fromarray(np.random.default_rng(0).integers(0, 256, (3000, 3000), dtype=np.uint8)).save(figure)
+        font = os.environ.get('MATHART_BENCH_FONT')
+        spec = {**make_poster.DEFAULT_SPEC, 'figure': figure, 'dpi': dpi}
+        if font:
+            spec.update(regular_font=font, italic_font=font)
+        make_poster.load_figure(figure)  # decoding the figure is not part of the composition
+
+        start = time.perf_counter()
+        if streamed:
+            make_poster.stream_poster(spec, os.path.join(directory, 'poster.tif'))
+        else:
+            make_poster.build_poster(spec).save(os.path.join(directory, 'poster.jpg'))
+        elapsed = time.perf_counter() - start
+        width, height = make_poster.layout(spec, (3000, 3000))['size']
+    return elapsed, width * height
+
+
+# name prefix: (function, unit of the throughput)
+BENCHMARKS = {
+    'newton': (newton, 'pixels'),
+    'chaos_game': (chaos_game, 'points'),
+    'fibonacci_circle': (fibonacci_circle, 'terms'),
+    'brownian_motion': (brownian_motion, 'walks'),
+    'poster': (poster, 'pixels'),
+}
+
+
+def case_name(benchmark: str, **params):
+    return benchmark + '/' + ','.join(f'{name}={value}' for name, value in params.items())
+
+
+SUITES = {
+    'quick': ([case_name('newton', degree=d, resolution=r) for d in (3, 5) for r in (500, 1000)]
+              + [case_name('chaos_game', n=n) for n in (10 ** 5, 10 ** 6)]
+              + [case_name('fibonacci_circle', n=n) for n in (10 ** 4, 10 ** 5)]
+              + [case_name('brownian_motion', n_walks=500)]
+              + [case_name('poster', dpi=dpi) for dpi in (100, 200)]),
+    'full': ([case_name('newton', degree=d, resolution=r) for d in (3, 5, 8) for r in (1000, 2000, 4000)]
+             + [case_name('chaos_game', n=10 ** e) for e in range(5, 9)]
+             + [case_name('fibonacci_circle', n=10 ** e) for e in range(4, 7)]
+             + [case_name('brownian_motion', n_walks=n) for n in (1000, 5000)]
+             + [case_name('poster', dpi=dpi) for dpi in (150, 300, 600)]
+             + [case_name('poster', dpi=600, streamed=True)]),
+}
+
+
+def parse_case(name: str):
+    """
+    :param name: str | Case name as made by case_name, e.g. 'newton/degree=3,resolution=1000'
+    :return: tuple (function, unit, parameters)
+    """
+    benchmark, _, params = name.partition('/')
+    if benchmark not in BENCHMARKS:
+        raise ValueError(f'Unknown benchmark {benchmark!r}, expected one of {sorted(BENCHMARKS)}')
+    function, unit = BENCHMARKS[benchmark]
+    kwargs = {}
+    for item in filter(None, params.split(',')):
+        key, _, value = item.partition('=')
+        kwargs[key] = json.loads(value.lower()) if value.lower() in ('true', 'false') else int(value)
+    return function, unit, kwargs
+
+
+def peak_rss_mb():
+    """
+    :return: float with the peak resident set size of this process in megabytes
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10  # bytes on macOS, kilobytes on Linux
+
+
+# %% running
+
+def run_child(name: str):
+    """
+    Run one case in this process and print its measurements as JSON, the parent reads them from stdout.
+    """
+    function, unit, kwargs = parse_case(name)
+    seconds, amount = function(**kwargs)
+    print(json.dumps({'case': name, 'wall_s': seconds, 'peak_rss_mb': peak_rss_mb(),
+                      'throughput': amount / seconds, 'unit': f'{unit}/s'}))
+
+
+def run_case(name: str, repeat: int = 1, timeout: float = None):
+    """
+    :param name: str | Case name
+    :param repeat: int | Number of runs, each in a new process, the fastest is kept
+    :param timeout: float | Seconds before a run is killed
+    :return: dict of measurements, with 'error' instead when the case failed
+    """
+    runs = []
+    for _ in range(repeat):
+        try:
+            result = subprocess.run([sys.executable, '-m', 'benchmarks.run', '--child', name], capture_output=True,
+                                    text=True, timeout=timeout, cwd=os.path.dirname(os.path.dirname(RESULTS_DIR)))
+        except subprocess.TimeoutExpired:
+            return {'case': name, 'error': f'timed out after {timeout} s'}
+        if result.returncode != 0:
+            return {'case': name, 'error': result.stderr.strip().splitlines()[-1] if result.stderr else 'failed'}
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    return {**min(runs, key=lambda run: run['wall_s']), 'peak_rss_mb': max(run['peak_rss_mb'] for run in runs)}
+
+
+def compare(result: dict, baseline: dict, tolerance: float):
+    """
+    :param result: dict | Measurements of a case
+    :param baseline: dict | Baseline measurements of the same case
+    :param tolerance: float | Allowed relative increase of wall time and peak RSS
+    :return: list of str describing the regressions, empty when there are none
+    """
+    regressions = []
+    for metric in ('wall_s', 'peak_rss_mb'):
+        if result[metric] > baseline[metric] * (1 + tolerance):
+            regressions.append(f'{metric} {baseline[metric]:.3g} -> {result[metric]:.3g} '
+                               f'(+{result[metric] / baseline[metric] - 1:.0%})')
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(RESULTS_DIR)).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def profile(name: str, top: int = 25):
+    """
+    Run one case in this process under cProfile and print the functions with the largest cumulative time.
+    """
+    function, _, kwargs = parse_case(name)
+    profiler = cProfile.Profile()
+    profiler.runcall(function, **kwargs)
+    pstats.Stats(profiler).sort_stats('cumulative').print_stats(top)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--suite', choices=sorted(SUITES), default='quick')
+    parser.add_argument('--cases', nargs='+', help='only run the cases whose name contains one of these strings')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per case, the fastest is kept')
+    parser.add_argument('--timeout', type=float, default=None, help='seconds before a case is killed')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='relative increase flagged as a regression')
+    parser.add_argument('--history', default=HISTORY, help='JSON Lines file the results are appended to')
+    parser.add_argument('--baseline', default=BASELINE, help='JSON file with the baseline of every case')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--list', action='store_true', help='print the cases of the suite and exit')
+    parser.add_argument('--profile', metavar='CASE', help='profile one case in this process instead')
+    parser.add_argument('--child', metavar='CASE', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_child(args.child)
+    if args.profile:
+        return profile(args.profile)
+
+    cases = [case for case in SUITES[args.suite] if not args.cases or any(part in case for part in args.cases)]
+    if args.list:
+        print('\n'.join(cases))
+        return
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    run = {'time': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': git_commit(),
+           'host': platform.node(), 'python': platform.python_version(), 'numpy': np.__version__}
+    results, flagged, failed = [], 0, 0
+    print(f'{"case":<42} {"wall [s]":>9} {"peak RSS [MB]":>13} {"throughput":>18}')
+    for case in cases:
+        result = run_case(case, repeat=args.repeat, timeout=args.timeout)
+        results.append(result)
+        if 'error' in result:
+            print(f'{case:<42} {"failed: " + result["error"]}')
+            failed += 1
+            continue
+        regressions = compare(result, baseline[case], args.tolerance) if case in baseline else []
+        flagged += bool(regressions)
+        print(f'{case:<42} {result["wall_s"]:>9.3f} {result["peak_rss_mb"]:>13.1f} '
+              f'{result["throughput"]:>11.3g} {result["unit"]:<8}' + ('  REGRESSION ' + '; '.join(regressions)
+                                                                     if regressions else ''))
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+    with open(args.history, 'a') as file:
+        for result in results:
+            file.write(json.dumps({**run, **result}) + '\n')
+
+    if args.save_baseline:
+        baseline.update({result['case']: result for result in results if 'error' not in result})
+        with open(args.baseline, 'w') as file:
+            json.dump(baseline, file, indent=2, sort_keys=True)
+
+    # a case that crashes is the worst regression
+    if failed:
+        print(f'{failed} of {len(cases)} cases failed')
+    if flagged:
+        print(f'{flagged} of {len(cases)} cases regressed by more than {args.tolerance:.0%}')
+    if failed or flagged:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Benchmark of the point-in-triangle tests of Sierpinski.
+Compares the per-point area test Sierpinski.is_inside_triangle with the batched barycentric test
+Sierpinski.contains on random points around the triangle, and checks that they agree.
+
+Run from the repository root:
+    python -m benchmarks.sierpinski_inside
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from motives.sierpinski_triangle import Point, Sierpinski
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scalar-points', type=int, default=10 ** 5)
+    parser.add_argument('--batch-points', type=int, nargs='+', default=[10 ** 5, 10 ** 6, 10 ** 7])
+    args = parser.parse_args()
+
+    st = Sierpinski(Point(1, 1), Point(2, np.sqrt(3)), Point(3, 1))
+    rng = np.random.default_rng(0)
+    xmin, xmax, ymin, ymax = st.bounds()
+
+    def random_points(n):
+        return np.column_stack([rng.uniform(xmin - 0.5, xmax + 0.5, n), rng.uniform(ymin - 0.5, ymax + 0.5, n)])
+
+    points = random_points(args.scalar_points)
+    start = time.perf_counter()
+    scalar = np.array([st.is_inside_triangle(Point(x, y)) for x, y in points])
+    t_scalar = time.perf_counter() - start
+    agreement = np.mean(scalar == st.contains(points))
+    print(f'area test:        {args.scalar_points:>10} points {t_scalar:8.3f} s '
+          f'{args.scalar_points / t_scalar:14.0f} points/s')
+
+    for n in args.batch_points:
+        points = random_points(n)
+        start = time.perf_counter()
+        st.contains(points)
+        t_batch = time.perf_counter() - start
+        print(f'barycentric test: {n:>10} points {t_batch:8.3f} s {n / t_batch:14.0f} points/s')
+    print(f'agreement with the area test: {agreement:.6f}')
+
+
+if __name__ == '__main__':
+    main()
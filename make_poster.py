@@ -1,6 +1,18 @@
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import struct
+import tempfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
 from PIL import Image, ImageDraw, ImageFont, ImageFilter
 import numpy as np
 import textwrap
+from tqdm import tqdm
 
 
 def blank_poster(mode: str, size: tuple, color: str):
@@ -35,127 +47,548 @@ def include_figure(poster, figure, pos: tuple):
     poster.paste(figure, pos)
 
 
-if __name__ == '__main__':
+DEFAULT_SPEC = {
+    # an image file, or {'motive': name in MOTIVES, **parameters} to render the figure from a motive
+    'figure': 'figures/newton_fractals/convrate_resolution10.png',
+    'output': None,  # defaults to posters/{figure name}_{width_cm}x{height_cm}.jpg
+    'width_cm': 30,
+    'height_cm': 40,
+    'dpi': 225,
+    'figure_width': 0.9,  # fraction of the poster width
+    'background': 'white',
+    'text_color': 'black',
+    # see ~/Library/Fonts/ to see alternatives
+    'regular_font': 'PlayfairDisplay-Regular.otf',
+    'italic_font': 'PlayfairDisplay-Italic.otf',
+    'algorithm': ("        1.    Start with a triangle"
+                  "\n        2.    Pick a corner"
+                  "\n        3.    Move halfway to a random corner"
+                  "\n        4.    Mark a point"
+                  "\n        5.    Repeat step 3-4"
+                  "\n "
+                  "\nThe pattern emerges as points accumulates"),
+    'signature': 'Mathematical Art',
+    'title': 'Sierpínsky Triangle',
+}
+
+BUILD_STATE = 'posters/.build_state.json'
+
+
+@lru_cache(maxsize=None)
+def load_font(path: str, size: int):
     """
-    TODO:
-        * Scale font based on figure size, should be same ratio
-        * Scale position based on figure size
-        * Figure position is not exactly in middle
-        * Create functions to clean main
+    Fonts are reused by every poster of the same size, load each (path, size) once per process.
+    :param path: str | Font file, or a font name found in the system font directories
+    :param size: int | Font size in pixels
+    :return: ImageFont
     """
-    # get blank poster
-    dpi = 225
-    width_cm = 30
-    height_cm = 40
+    return ImageFont.truetype(path, size)
 
-    # scalers
-    font_scaler = height_cm / 70  # 70 is original height for which the fonts were selected
 
-    poster_width_px = int(width_cm * dpi / 2.54)  # Convert cm to pixels
-    poster_height_px = int(height_cm * dpi / 2.54)  # Convert cm to pixels
-    # poster_height_px = 14172  # Convert 120cm to pixels
+@lru_cache(maxsize=8)
+def load_figure(path: str):
+    """
+    Load and decode a figure once per process, every size variant of a poster is resized from the same copy.
+    :param path: str | Image file of the figure
+    :return: Image, must not be modified by the caller
+    """
+    with Image.open(path) as figure:
+        figure.load()
+        return figure.copy()
 
-    # width = 9450
-    # height = 14172
-    poster = blank_poster('RGB', size=(poster_width_px, poster_height_px), color='white')
 
-    # load image file and set size
-    # figure = Image.open('figures/triangle2.png')
-    figname = 'convrate_resolution10'
-    figure = Image.open(f'figures/newton_fractals/{figname}.png')
-    # Assuming the figure should take up most of the width but leave room for text and signature
-    figure_width = int(poster_width_px * 0.9)  # 90% of the poster width
-    figure_height = int(figure_width * figure.height / figure.width)  # Maintain aspect ratio
+def file_hash(path: str):
+    """
+    :param path: str | File to hash
+    :return: str with the sha256 hex digest of the file contents
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def newton_figure(image: str = 'basins', cmap: str = 'Greys', **params):
+    """
+    :param image: str | 'basins' or 'convergence_rate'
+    :param cmap: str | Colormap of the figure
+    :param params: Parameters of Newton_fractals
+    :return: Image of the fractal at the resolution of its grid
+    """
+    from motives.newton_fractals import Newton_fractals
+
+    nf = Newton_fractals(**params)
+    nf.compute()
+    if image == 'basins':
+        return nf.render_basins_image(cmap=cmap)
+    if image == 'convergence_rate':
+        return nf.render_convergence_rate_image(cmap=cmap)
+    raise ValueError(f'Unknown Newton fractal image {image!r}, expected "basins" or "convergence_rate"')
+
+
+def sierpinski_figure(n: int = 10 ** 7, width_px: int = 3000, height_px: int = 2600, seed: int = 0,
+                      corners: tuple = ((1, 1), (2, 3 ** 0.5), (3, 1)), method: str = 'log', gamma: float = 0.5):
+    """
+    :return: Image of the density of n points of the chaos game
+    """
+    from motives.raster import tone_map, to_image
+    from motives.sierpinski_triangle import Point, Sierpinski
+
+    st = Sierpinski(*(Point(x, y) for x, y in corners), seed=seed)
+    return to_image(tone_map(st.accumulate(n, width_px, height_px, progress=False), method=method, gamma=gamma))
+
+
+def fibonacci_circle_figure(n: int = 10 ** 6, size_px: int = 3000, sequence: str = 'fibonacci',
+                            mapping: str = 'leading_digits', method: str = 'log', gamma: float = 0.5, **params):
+    """
+    :param params: Parameters of the mapping
+    :return: Image of the chords between consecutive terms of the mapped sequence
+    """
+    from motives.fibonacci_circle import get_circle_position, mapped_sequence, render_chords
+    from motives.raster import to_image
+
+    values, ticks = mapped_sequence(sequence, mapping, n, **params)
+    xs, ys = get_circle_position(values, max_num=ticks)
+    return to_image(render_chords(xs, ys, size_px=size_px, method=method, gamma=gamma))
+
+
+def brownian_motion_figure(n_walks: int = 20000, width_px: int = 3543, height_px: int = 2362, p_up: float = 0.5,
+                           seed: int = 0, method: str = 'log', gamma: float = 0.5, **params):
+    """
+    :param params: Parameters of Brownian_motion
+    :return: Image of the density of n_walks walks
+    """
+    from motives.brownian_motion import Brownian_motion
+    from motives.raster import to_image
+
+    bm = Brownian_motion(p_up=p_up, seed=seed, **params)
+    return to_image(bm.render_density(n_walks, width_px, height_px, method=method, gamma=gamma, progress=False))
+
+
+# figures rendered from motive parameters, a spec with 'figure': {'motive': name, **parameters} uses them
+MOTIVES = {
+    'newton_fractals': newton_figure,
+    'sierpinski_triangle': sierpinski_figure,
+    'fibonacci_circle': fibonacci_circle_figure,
+    'brownian_motion': brownian_motion_figure,
+}
+MOTIVES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'motives')
+
+
+def figure_digest(figure):
+    """
+    :param figure: str or dict | Image file, or motive name and parameters
+    :return: str with a hash of the figure file, or of the motive parameters, the source of the figure function
+             with its defaults and the code of the motives
+    """
+    if isinstance(figure, str):
+        return file_hash(figure)
+    if figure.get('motive') not in MOTIVES:
+        raise ValueError(f"Unknown motive {figure.get('motive')!r}, expected one of {sorted(MOTIVES)}")
+    from motives.render_cache import cache_key
+
+    sources = tuple(sorted(os.path.join(MOTIVES_DIR, name) for name in os.listdir(MOTIVES_DIR) if name.endswith('.py')))
+    function = inspect.getsource(MOTIVES[figure['motive']])
+    return cache_key('poster figure', {'figure': figure, 'function': function}, sources)
+
+
+@lru_cache(maxsize=8)
+def _render_motive(motive: str):
+    """
+    :param motive: str | JSON of the motive name and parameters, hashable for the lru_cache
+    :return: Image, must not be modified by the caller
+    """
+    from motives.render_cache import default_cache
+
+    params = json.loads(motive)
+    key = figure_digest(params)
+    name = params.pop('motive')
+
+    render_cache = default_cache()
+    cached = render_cache.load(key)
+    if cached is not None:
+        return Image.fromarray(cached['image'])
+    figure = MOTIVES[name](**params)
+    render_cache.save(key, image=np.asarray(figure))
+    return figure
+
+
+def source_figure(figure):
+    """
+    The figure of a poster spec, decoded or rendered once per process. Figures rendered from motive
+    parameters are kept in the render cache, so rebuilding a poster does not rerun the motive.
+    :param figure: str or dict | Image file, or {'motive': name in MOTIVES, **parameters of the motive}
+    :return: Image, must not be modified by the caller
+    """
+    if isinstance(figure, str):
+        return load_figure(figure)
+    return _render_motive(json.dumps(figure, sort_keys=True))
+
+
+def output_path(spec: dict):
+    """
+    :param spec: dict | Poster spec
+    :return: str with the file the poster is saved to
+    """
+    if spec.get('output'):
+        return spec['output']
+    if isinstance(spec['figure'], str):
+        figname = os.path.splitext(os.path.basename(spec['figure']))[0]
+    else:
+        figname = spec['figure']['motive']
+    return f"posters/{figname}_{spec['width_cm']}x{spec['height_cm']}.jpg"
+
+
+def load_manifest(path: str):
+    """
+    Read a list of poster specs from a JSON or YAML manifest. The manifest is either a list of specs or a mapping
+    with 'defaults', shared by all posters, and 'posters'. A spec with 'sizes', a list of [width_cm, height_cm],
+    expands to one poster per size. Missing keys are taken from DEFAULT_SPEC.
+    :param path: str | .json, .yaml or .yml file, YAML needs pyyaml
+    :return: list of complete poster specs
+    """
+    with open(path) as file:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ModuleNotFoundError:
+                raise ValueError(f'Reading the YAML manifest {path} requires pyyaml, or use a JSON manifest.')
+            manifest = yaml.safe_load(file)
+        else:
+            manifest = json.load(file)
+
+    if isinstance(manifest, list):
+        manifest = {'posters': manifest}
+    defaults = {**DEFAULT_SPEC, **manifest.get('defaults', {})}
+
+    specs = []
+    for entry in manifest['posters']:
+        spec = {**defaults, **entry}
+        sizes = spec.pop('sizes', None) or [(spec['width_cm'], spec['height_cm'])]
+        if len(sizes) > 1 and spec['output']:
+            raise ValueError(f"The poster of {spec['figure']} has several sizes but a single output {spec['output']}.")
+        specs += [{**spec, 'width_cm': width_cm, 'height_cm': height_cm} for width_cm, height_cm in sizes]
+
+    unknown = set().union(*specs) - set(DEFAULT_SPEC) if specs else set()
+    if unknown:
+        raise ValueError(f'Unknown poster spec keys {sorted(unknown)}, expected some of {sorted(DEFAULT_SPEC)}.')
+    return specs
+
+
+def layout(spec: dict, figure_size: tuple):
+    """
+    Place the figure and the text of a poster, without drawing anything.
+    :param spec: dict | Poster spec
+    :param figure_size: tuple | (width, height) of the source figure in pixels
+    :return: dict with the poster 'size', the figure 'box' (x, y, width, height) and the
+             'texts' as a list of (x, y, text, font)
+    """
+    poster_width_px = int(spec['width_cm'] * spec['dpi'] / 2.54)  # Convert cm to pixels
+    poster_height_px = int(spec['height_cm'] * spec['dpi'] / 2.54)
+
+    # scalers
+    font_scaler = spec['height_cm'] / 70  # 70 is original height for which the fonts were selected
 
-    # Resize figure image
-    figure_image_resized = figure.resize((figure_width, figure_height), Image.ANTIALIAS)
+    # Assuming the figure should take up most of the width but leave room for text and signature
+    figure_width = int(poster_width_px * spec['figure_width'])
+    figure_height = int(figure_width * figure_size[1] / figure_size[0])  # Maintain aspect ratio
 
     # Calculate figure position to be central
     figure_x = (poster_width_px - figure_width) // 2
     figure_y = (poster_height_px - figure_height) // 2 - 300  # Shift up slightly to leave space for text and signature
 
-    # Paste the figure
-    poster.paste(figure_image_resized, (figure_x, figure_y))
-
-    # Add description text below the figure
-    draw = ImageDraw.Draw(poster)
     title_font_size = int(68 * font_scaler)  # 68 for height 70. Scale with
-    signature1_font_size = int(36 * font_scaler)
-    signature2_font_size = int(36 * font_scaler)
-    # set up font and texts, see  ~/Library/Fonts/ to see alternatives
-    # title_font = ImageFont.truetype("PlayfairDisplay-BlackItalic.otf", title_font_size)
-    algo_font = ImageFont.truetype("PlayfairDisplay-Regular.otf", title_font_size)
-    signature1_font = ImageFont.truetype("PlayfairDisplay-Regular.otf", signature1_font_size)  # 48
-    signature2_font = ImageFont.truetype("PlayfairDisplay-Italic.otf", signature2_font_size)  # 48
-    #    algorithm = "1. Draw the corners in a triangle\
-    #    \n2. Select one corner as your current point\
-    #    \n3. Draw a point halfway between the current point \
-    #    \n    and a randomly selected corner\
-    #    \n4. The middle point is the current point\
-    #    \n5. Repeat step 3-4"
-
-    algorithm = ("        1.    Start with a triangle\
-    \n        2.    Pick a corner\
-    \n        3.    Move halfway to a random corner\
-    \n        4.    Mark a point\
-    \n        5.    Repeat step 3-4\
-    \n \
-    \nThe pattern emerges as points accumulates")
-
-
-    algorithm_lines = algorithm.split('\n')
-
-    signature1 = 'Mathematical Art'
-    signature2 = 'Sierpínsky Triangle'
-
-    # Write algorithm steps
-    y = figure_y + figure_height - int(500 * font_scaler)  # Below the figure
+    signature_font_size = int(36 * font_scaler)
+    algo_font = load_font(spec['regular_font'], title_font_size)
+    signature1_font = load_font(spec['regular_font'], signature_font_size)
+    signature2_font = load_font(spec['italic_font'], signature_font_size)
+
+    texts = []
+
+    # Write algorithm steps below the figure
+    y = figure_y + figure_height - int(500 * font_scaler)
     extra_spacing = 35
-    for i, line in enumerate(algorithm_lines):
-        temp_bbox = draw.textbbox((0, 0), line, font=algo_font)
-        # x = (poster_width_px - temp_bbox[2]) // 2
-        x = poster_width_px // 2 - int(400 * font_scaler)
-        y += title_font_size + extra_spacing  # Move to the next line; adjust spacing as needed
-        draw.text((x, y), line, fill="black", font=algo_font)
-        print(temp_bbox[2])
-
-    # Title
-    #title_width, title_height = draw.textsize(title, font=title_font)
-    #title_bbox = draw.textbbox((0, 0), title, font=title_font)
-    #title_x = (poster_width_px - title_bbox[2]) // 2
-    #title_y = figure_y + figure_height + 50  # Above the figure
-    #draw.text((title_x, title_y), title, fill="black", font=title_font)
-
-    # Signature
-    #signature1_width, signature1_height = draw.textsize(signature1, font=signature1_font)
-    signature1_bbox = draw.textbbox((0,0), signature1, font=signature1_font)
-    signature1_x = poster_width_px - signature1_bbox[2] - 100  # Right corner, with margin
-    signature1_y = poster_height_px - signature1_bbox[3] - 100  # Bottom corner, with margin
-    draw.text((signature1_x, signature1_y), signature1, fill="black", font=signature1_font)
-
-    signature2_bbox = draw.textbbox((0, 0), signature2, font=signature2_font)
-    signature2_x = poster_width_px - signature2_bbox[2] - 100  # Right corner, with margin
-    signature2_y = poster_height_px - signature1_bbox[3] - signature2_bbox[3] - 100  # Below signature1
-    draw.text((signature2_x, signature2_y), signature2, fill="black", font=signature2_font)
-
-    # Save the poster
-    poster.save(f'posters/{figname}_{width_cm}x{height_cm}.jpg')
-
-    # drawing context
-
-    #include_figure(poster, figure, pos=(poster.width // 2, poster.height // 2))
-
-
-    # calculate text size and position
-    #title_bbox = draw.textbbox((0, 0), title, font=title_font)
-    #x_title = (poster.width - title_bbox[2]) // 2
-    #y_title = 100  # (poster.height - text_bbox[3]) // 2
-    #draw.text((x_title, y_title), title, fill='black', font=title_font)
-
-    # Paste the ornament onto the poster
-    #poster.paste(ornament_blurred, (x, y), mask=ornament_blurred) # NOT WORKING
-
-    # Save or display the modified poster
-    #poster.show()
-    #poster.save('poster_test.png')
+    x = poster_width_px // 2 - int(400 * font_scaler)
+    for line in spec['algorithm'].split('\n'):
+        y += title_font_size + extra_spacing  # Move to the next line
+        texts.append((x, y, line, algo_font))
+
+    # Signature in the bottom right corner, the title above it
+    signature1_bbox = signature1_font.getbbox(spec['signature'])
+    signature2_bbox = signature2_font.getbbox(spec['title'])
+    texts.append((poster_width_px - signature1_bbox[2] - 100, poster_height_px - signature1_bbox[3] - 100,
+                  spec['signature'], signature1_font))
+    texts.append((poster_width_px - signature2_bbox[2] - 100,
+                  poster_height_px - signature1_bbox[3] - signature2_bbox[3] - 100, spec['title'], signature2_font))
+
+    return {'size': (poster_width_px, poster_height_px),
+            'box': (figure_x, figure_y, figure_width, figure_height),
+            'texts': texts}
+
+
+def render_strip(spec: dict, figure, placement: dict, top: int, bottom: int):
+    """
+    Render the poster rows [top, bottom). Only the source rows of the figure that land in the strip are
+    resampled, and only the text whose bounding box intersects the strip is drawn.
+    :param spec: dict | Poster spec
+    :param figure: Image | Source figure
+    :param placement: dict | Output of layout
+    :param top: int | First poster row of the strip
+    :param bottom: int | Poster row after the last row of the strip
+    :return: RGB Image of size (poster width, bottom - top)
+    """
+    strip = blank_poster('RGB', size=(placement['size'][0], bottom - top), color=spec['background'])
+
+    figure_x, figure_y, figure_width, figure_height = placement['box']
+    first, last = max(top, figure_y) - figure_y, min(bottom, figure_y + figure_height) - figure_y
+    if first < last:
+        scale = figure.height / figure_height
+        rows = figure.resize((figure_width, last - first), Image.LANCZOS,
+                             box=(0, first * scale, figure.width, last * scale))
+        include_figure(strip, rows, (figure_x, figure_y + first - top))
 
+    draw = ImageDraw.Draw(strip)
+    for x, y, text, font in placement['texts']:
+        _, text_top, _, text_bottom = font.getbbox(text)
+        if y + text_bottom > top and y + text_top < bottom:
+            draw.text((x, y - top), text, fill=spec['text_color'], font=font)
+    return strip
+
+
+def build_poster(spec: dict):
+    """
+    Compose one poster: the resized figure with the algorithm, the signature and the title.
+    :param spec: dict | Poster spec, see DEFAULT_SPEC
+    :return: Image
+    """
+    figure = source_figure(spec['figure'])
+    placement = layout(spec, figure.size)
+    return render_strip(spec, figure, placement, 0, placement['size'][1])
+
+
+class StripTiffWriter:
+    """
+    Minimal writer of strip organised, 8-bit RGB or greyscale TIFF files. Strips are appended one at a time and
+    the directory is written on close, so an image never has to be held in memory at once.
+    """
+
+    # TIFF field types
+    SHORT, LONG, RATIONAL = 3, 4, 5
+
+    def __init__(self, path: str, size: tuple, mode: str = 'RGB', rows_per_strip: int = 256,
+                 compression: str = None, dpi: float = None):
+        """
+        :param path: str | Output file
+        :param size: tuple | (width, height) of the image in pixels
+        :param mode: str | 'RGB' or 'L'
+        :param rows_per_strip: int | Height of every strip but the last
+        :param compression: str | None or 'deflate', deflate uses the horizontal difference predictor
+        :param dpi: float | Resolution stored in the file
+        """
+        if mode not in ('RGB', 'L'):
+            raise ValueError(f'Mode {mode} is not supported, use RGB or L.')
+        if compression not in (None, 'deflate'):
+            raise ValueError(f'Compression {compression} is not supported, use None or deflate.')
+        self.width, self.height = size
+        self.mode = mode
+        self.rows_per_strip = rows_per_strip
+        self.compression = compression
+        self.dpi = dpi
+        self.offsets, self.byte_counts = [], []
+        self.rows = 0
+        # upper bound of the directory written on close: 14 entries, then the strip offsets and byte counts,
+        # bits per sample and the two resolutions, all addressed with 32 bit offsets
+        strips = -(-self.height // rows_per_strip)
+        self.directory_size = 2 + 12 * 14 + 4 + 8 * strips + 6 + 16
+        self.file = open(path, 'wb')
+        self.file.write(b'II*\x00\x00\x00\x00\x00')  # little endian, directory offset written on close
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.close()
+        else:
+            self.file.close()
+
+    def write_strip(self, strip):
+        """
+        :param strip: Image or uint8 array (rows, width[, 3]) | The next rows_per_strip rows, fewer for the last strip
+        """
+        pixels = np.asarray(strip.convert(self.mode) if isinstance(strip, Image.Image) else strip, dtype=np.uint8)
+        expected = min(self.rows_per_strip, self.height - self.rows)
+        if pixels.shape[:2] != (expected, self.width):
+            raise ValueError(f'Expected a strip of {expected} x {self.width} pixels, got {pixels.shape[:2]}.')
+        if self.compression == 'deflate':
+            pixels = pixels.copy()
+            pixels[:, 1:] -= pixels[:, :-1].copy()  # horizontal predictor, per sample and modulo 256
+            data = zlib.compress(pixels.tobytes(), 6)
+        else:
+            data = np.ascontiguousarray(pixels).tobytes()
+        if self.file.tell() + len(data) + 1 + self.directory_size >= 2 ** 32:
+            self.file.close()
+            raise ValueError('The image exceeds the 4 GB limit of TIFF, use deflate compression or a lower dpi.')
+        self.offsets.append(self.file.tell())
+        self.byte_counts.append(len(data))
+        self.file.write(data)
+        if self.file.tell() & 1:
+            self.file.write(b'\x00')  # keep offsets word aligned
+        self.rows += expected
+
+    def close(self):
+        if self.rows != self.height:
+            self.file.close()
+            raise ValueError(f'Only {self.rows} of {self.height} rows were written.')
+        samples = 3 if self.mode == 'RGB' else 1
+        tags = [(256, self.LONG, [self.width]),
+                (257, self.LONG, [self.height]),
+                (258, self.SHORT, [8] * samples),
+                (259, self.SHORT, [8 if self.compression == 'deflate' else 1]),
+                (262, self.SHORT, [2 if self.mode == 'RGB' else 1]),
+                (273, self.LONG, self.offsets),
+                (277, self.SHORT, [samples]),
+                (278, self.LONG, [self.rows_per_strip]),
+                (279, self.LONG, self.byte_counts),
+                (284, self.SHORT, [1])]
+        if self.dpi:
+            resolution = [round(self.dpi * 10000), 10000]
+            tags += [(282, self.RATIONAL, resolution), (283, self.RATIONAL, resolution), (296, self.SHORT, [2])]
+        if self.compression == 'deflate':
+            tags.append((317, self.SHORT, [2]))
+        tags.sort()  # TIFF requires the entries in ascending tag order
+
+        # values that do not fit in the 4 byte entry follow the directory
+        directory = self.file.tell()
+        entries, extra = b'', b''
+        extra_offset = directory + 2 + 12 * len(tags) + 4
+        for tag, kind, values in tags:
+            if kind == self.RATIONAL:
+                value = struct.pack('<2I', *values)
+                count = 1
+            else:
+                value = struct.pack(f"<{len(values)}{'H' if kind == self.SHORT else 'I'}", *values)
+                count = len(values)
+            if len(value) <= 4:
+                entries += struct.pack('<HHI', tag, kind, count) + value.ljust(4, b'\x00')
+            else:
+                entries += struct.pack('<HHII', tag, kind, count, extra_offset + len(extra))
+                extra += value
+        self.file.write(struct.pack('<H', len(tags)) + entries + struct.pack('<I', 0) + extra)
+        self.file.seek(4)
+        self.file.write(struct.pack('<I', directory))
+        self.file.close()
+
+
+def stream_poster(spec: dict, path: str, strip_height: int = 512, compression: str = 'deflate'):
+    """
+    Compose a poster strip by strip straight into a TIFF file, for print sizes whose full canvas does not fit
+    in memory. Peak memory is about one strip of the poster plus the source figure.
+    :param spec: dict | Poster spec, see DEFAULT_SPEC
+    :param path: str | Output TIFF file
+    :param strip_height: int | Number of poster rows rendered at a time
+    :param compression: str | None or 'deflate'
+    :return: path
+    """
+    figure = source_figure(spec['figure'])
+    placement = layout(spec, figure.size)
+    width, height = placement['size']
+    with StripTiffWriter(path, (width, height), rows_per_strip=strip_height, compression=compression,
+                         dpi=spec['dpi']) as writer:
+        for top in range(0, height, strip_height):
+            writer.write_strip(render_strip(spec, figure, placement, top, min(top + strip_height, height)))
+    return path
+
+
+def spec_digest(spec: dict, figure_digest: str):
+    """
+    :param spec: dict | Poster spec
+    :param figure_digest: str | Hash of the figure, see figure_digest
+    :return: str identifying the inputs of a poster, it changes whenever the poster would
+    """
+    return hashlib.sha256(json.dumps([spec, figure_digest], sort_keys=True).encode()).hexdigest()
+
+
+def _build_one(spec: dict):
+    """
+    Build and save one poster. TIFF outputs are streamed strip by strip.
+    :return: str with the output path
+    """
+    path = output_path(spec)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    if path.endswith(('.tif', '.tiff')):
+        stream_poster(spec, path)
+    else:
+        build_poster(spec).save(path)
+    return path
+
+
+def build_all(specs: list, workers: int = None, force: bool = False, state_path: str = BUILD_STATE):
+    """
+    Build many posters in a process pool, one poster per task. Posters whose figure and spec are unchanged since
+    the last build, and whose output still exists, are skipped. The hashes of the last build are kept in
+    state_path. Figures given by motive parameters count as changed when the parameters or the code of the
+    motives change.
+    :param specs: list | Poster specs, e.g. from load_manifest
+    :param workers: int | Number of processes, defaults to the number of CPUs, 1 builds in this process
+    :param force: bool | Rebuild every poster
+    :param state_path: str | JSON file with the input hashes of the posters built before
+    :return: tuple of (built, skipped) lists of output paths
+    """
+    paths = [output_path(spec) for spec in specs]
+    if len(set(paths)) < len(paths):
+        raise ValueError('Several posters are saved to the same output, give them different sizes or outputs.')
+
+    state = {}
+    if os.path.exists(state_path):
+        with open(state_path) as file:
+            state = json.load(file)
+
+    figures = {json.dumps(spec['figure'], sort_keys=True): spec['figure'] for spec in specs}
+    figure_digests = {key: figure_digest(figure) for key, figure in figures.items()}
+    todo, skipped, digests = [], [], {}
+    for path, spec in zip(paths, specs):
+        figure = json.dumps(spec['figure'], sort_keys=True)
+        digests[path] = spec_digest(spec, figure_digests[figure])
+        if not force and state.get(path) == digests[path] and os.path.exists(path):
+            skipped.append(path)
+        else:
+            todo.append(spec)
+
+    if workers == 1 or len(todo) <= 1:
+        built = [_build_one(spec) for spec in todo]
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            # render motive figures once here and hand them to the workers as image files, which does not
+            # depend on the render cache keeping them
+            rendered = {}
+            for spec in todo:
+                figure = json.dumps(spec['figure'], sort_keys=True)
+                if not isinstance(spec['figure'], str) and figure not in rendered:
+                    rendered[figure] = os.path.join(directory, f'{figure_digests[figure]}.png')
+                    source_figure(spec['figure']).save(rendered[figure], compress_level=1)
+            tasks = [{**spec, 'output': output_path(spec),
+                      'figure': rendered.get(json.dumps(spec['figure'], sort_keys=True), spec['figure'])}
+                     for spec in todo]
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                built = list(tqdm(executor.map(_build_one, tasks), total=len(tasks), unit='posters'))
+
+    state.update({path: digests[path] for path in built})
+    os.makedirs(os.path.dirname(state_path) or '.', exist_ok=True)
+    with open(state_path + '.tmp', 'w') as file:
+        json.dump(state, file, indent=2, sort_keys=True)
+    os.replace(state_path + '.tmp', state_path)
+    return built, skipped
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build posters from a manifest of poster specs.')
+    parser.add_argument('manifest', nargs='?', help='JSON or YAML manifest, without one the default poster is built')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes, defaults to the CPU count')
+    parser.add_argument('--force', action='store_true', help='rebuild posters whose inputs are unchanged')
+    args = parser.parse_args()
+
+    specs = load_manifest(args.manifest) if args.manifest else [dict(DEFAULT_SPEC)]
+    built, skipped = build_all(specs, workers=args.workers, force=args.force)
+    print(f'Built {len(built)} posters, {len(skipped)} unchanged')
@@ -0,0 +1,336 @@
+"""
+Command line entry point rendering the motives and building posters, instead of editing the __main__ blocks.
+
+    python mathart.py newton_fractals --resolution 2000 --polynomial-degree 5 --image convergence_rate
+    python mathart.py sierpinski_triangle --n 100000000 --width-px 4000 --height-px 3464
+    python mathart.py fibonacci_circle --n 1000000 --size-px 3543
+    python mathart.py brownian_motion --n-walks 20000 --p-up 0.52
+    python mathart.py poster posters.json
+
+A long-lived worker keeps the imports and caches of its processes warm and renders jobs dropped in a spool
+directory, at most --jobs at a time:
+
+    python mathart.py worker spool/ --jobs 4
+    python mathart.py newton_fractals --resolution 8000 --spool spool/    # queue a job instead of running it
+
+A job is a JSON file {"command": ..., **options} in spool/incoming. The worker claims it by moving it to
+spool/running and writes the job with its outputs, or its error, to spool/done or spool/failed.
+Run one worker per spool directory, jobs left in spool/running by a worker that died are queued again when
+it restarts. Heavy modules are imported by the jobs that need them only.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# options of the motive commands: (flag, type, nargs, help), passed on to the figure functions of make_poster
+MOTIVE_OPTIONS = {
+    'newton_fractals': [
+        ('--polynomial-degree', int, None, 'degree of z^n - 1'),
+        ('--coefficients', float, '+', 'coefficients of another polynomial, highest degree first'),
+        ('--x-lim', float, 2, 'xmin xmax'),
+        ('--y-lim', float, 2, 'ymin ymax'),
+        ('--resolution', int, None, 'pixels along each axis'),
+        ('--max-basins-iter', int, None, 'maximum number of Newton iterations'),
+        ('--tolerance', float, None, 'convergence tolerance'),
+        ('--image', str, None, 'basins or convergence_rate'),
+        ('--cmap', str, None, 'matplotlib colormap'),
+    ],
+    'sierpinski_triangle': [
+        ('--n', int, None, 'number of points'),
+        ('--width-px', int, None, 'image width'),
+        ('--height-px', int, None, 'image height'),
+        ('--seed', int, None, 'seed of the chaos game'),
+        ('--method', str, None, 'tone mapping, log or gamma'),
+        ('--gamma', float, None, 'exponent of the gamma tone mapping'),
+    ],
+    'fibonacci_circle': [
+        ('--n', int, None, 'number of terms'),
+        ('--size-px', int, None, 'image width and height'),
+        ('--sequence', str, None, 'registered sequence, e.g. fibonacci, lucas, powers_of_two, primes'),
+        ('--mapping', str, None, 'mapping of the terms, e.g. leading_digits, digit_mod, residue'),
+        ('--digits', int, None, 'leading digits, for the leading_digits mapping'),
+        ('--position', int, None, 'digit position, for the digit_mod mapping'),
+        ('--modulus', int, None, 'modulus, for the digit_mod and residue mappings'),
+        ('--method', str, None, 'tone mapping, log or gamma'),
+        ('--gamma', float, None, 'exponent of the gamma tone mapping'),
+    ],
+    'brownian_motion': [
+        ('--n-walks', int, None, 'number of walks'),
+        ('--width-px', int, None, 'image width'),
+        ('--height-px', int, None, 'image height'),
+        ('--p-up', float, None, 'probability of a step up'),
+        ('--resolution', int, None, 'steps per walk'),
+        ('--seed', int, None, 'seed of the walks'),
+        ('--method', str, None, 'tone mapping, log or gamma'),
+        ('--gamma', float, None, 'exponent of the gamma tone mapping'),
+    ],
+}
+
+
+def default_output(command: str, options: dict):
+    """
+    :return: str with figures/{command}/{command}_{hash of the options}.png in the repository, the same options
+             always give the same file
+    """
+    text = json.dumps({'motive': command, **options}, sort_keys=True)
+    digest = hashlib.sha256(text.encode()).hexdigest()[:12]
+    return os.path.join(ROOT, 'figures', command, f'{command}_{digest}.png')
+
+
+def run_job(job: dict):
+    """
+    Render a motive or build posters.
+    :param job: dict | {'command': name of a motive or 'poster', **options of the command}
+    :return: list of the files written
+    """
+    options = dict(job)
+    command = options.pop('command')
+    if command == 'poster':
+        from make_poster import DEFAULT_SPEC, build_all, load_manifest
+
+        specs = load_manifest(options['manifest']) if options.get('manifest') else [dict(DEFAULT_SPEC)]
+        built, _ = build_all(specs, workers=options.get('workers'), force=options.get('force', False))
+        return built
+    if command not in MOTIVE_OPTIONS:
+        raise ValueError(f'Unknown command {command!r}, expected poster or one of {sorted(MOTIVE_OPTIONS)}')
+
+    from make_poster import source_figure
+
+    output = options.pop('output', None) or default_output(command, options)
+    figure = source_figure({'motive': command, **options})
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    figure.save(output)
+    return [output]
+
+
+# %% spool directory
+
+def spool_dirs(spool: str):
+    """
+    :return: dict of the directories of a spool, created if missing
+    """
+    dirs = {name: os.path.join(spool, name) for name in ('incoming', 'running', 'done', 'failed')}
+    for directory in dirs.values():
+        os.makedirs(directory, exist_ok=True)
+    return dirs
+
+
+def _write_json(path: str, content: dict):
+    """
+    Write JSON atomically, a reader never sees a partial file.
+    """
+    with open(path + '.tmp', 'w') as file:
+        json.dump(content, file, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def submit(spool: str, job: dict):
+    """
+    Queue a job for the workers of a spool directory. The output and manifest paths are resolved here, the worker
+    may run in another directory. Paths inside a manifest stay relative to the directory of the worker.
+    :return: str with the path of the queued job
+    """
+    job = dict(job)
+    for key in ('output', 'manifest'):
+        if job.get(key):
+            job[key] = os.path.abspath(job[key])
+    name = f'{time.strftime("%Y%m%d-%H%M%S")}-{uuid.uuid4().hex[:8]}.json'  # queued in order of submission
+    path = os.path.join(spool_dirs(spool)['incoming'], name)
+    _write_json(path, job)
+    return path
+
+
+def _warm_worker():
+    """
+    Initializer of the worker processes, they import what every job needs once and keep it.
+    """
+    import make_poster  # noqa: F401, imports numpy and PIL
+
+
+def check_job(job):
+    """
+    :param job: Decoded content of a job file
+    :return: str describing why the job cannot run, None for a valid job
+    """
+    if not isinstance(job, dict):
+        return f'A job is a JSON object, got {type(job).__name__}'
+    if job.get('command') not in ('poster', *MOTIVE_OPTIONS):
+        return f"Unknown command {job.get('command')!r}, expected poster or one of {sorted(MOTIVE_OPTIONS)}"
+    return None
+
+
+def _finish(dirs: dict, name: str, result: dict, failed: bool):
+    """
+    Record the result of a job in done/ or failed/ and release its file in running/. Errors are reported
+    rather than raised, the bookkeeping of one job must not stop the worker.
+    """
+    try:
+        _write_json(os.path.join(dirs['failed' if failed else 'done'], name), result)
+        os.remove(os.path.join(dirs['running'], name))
+    except (OSError, TypeError, ValueError) as error:
+        print(f'Could not record the result of {name}: {type(error).__name__}: {error}', flush=True)
+
+
+def _requeue(dirs: dict, name: str):
+    """
+    Move a claimed job back to incoming/, it is claimed again by a later poll.
+    """
+    try:
+        os.replace(os.path.join(dirs['running'], name), os.path.join(dirs['incoming'], name))
+    except OSError as error:
+        print(f'Could not requeue {name}: {type(error).__name__}: {error}', flush=True)
+
+
+def serve(spool: str, jobs: int = 2, poll: float = 0.5, once: bool = False):
+    """
+    Render the jobs of a spool directory until interrupted. Jobs run in a pool of jobs processes that live as
+    long as the worker, so modules and the in-memory caches of fonts and figures stay loaded between jobs.
+    Jobs left in spool/running by a worker that died are queued again at start. Invalid jobs are moved to
+    spool/failed without running.
+    When the process of a job dies, e.g. killed for lack of memory, the pool is replaced. A job that was running
+    alone is moved to spool/failed, jobs that were running together are queued again and then run one at a time,
+    so the job that killed its process is found without failing the others.
+    :param spool: str | Spool directory
+    :param jobs: int | Maximum number of jobs running at a time
+    :param poll: float | Seconds between checks for new jobs
+    :param once: bool | Stop when the queue is empty instead of waiting for more jobs
+    """
+    dirs = spool_dirs(spool)
+    for name in os.listdir(dirs['running']):
+        os.replace(os.path.join(dirs['running'], name), os.path.join(dirs['incoming'], name))
+
+    pending, suspects = {}, set()  # suspects were running when a process died, they run alone
+    pool = ProcessPoolExecutor(max_workers=jobs, initializer=_warm_worker)
+    try:
+        while True:
+            for name in sorted(os.listdir(dirs['incoming'])):
+                isolated = any(running in suspects for running, _, _ in pending.values())
+                if len(pending) >= jobs or isolated or (name in suspects and pending):
+                    break
+                if not name.endswith('.json'):
+                    continue
+                running = os.path.join(dirs['running'], name)
+                try:
+                    os.rename(os.path.join(dirs['incoming'], name), running)  # claim, the job may have been withdrawn
+                except FileNotFoundError:
+                    continue
+                try:
+                    with open(running) as file:
+                        job = json.load(file)
+                except (OSError, ValueError) as error:
+                    _finish(dirs, name, {'error': f'Invalid job: {error}'}, failed=True)
+                    continue
+                error = check_job(job)
+                if error is not None:
+                    _finish(dirs, name, {'job': job, 'error': f'Invalid job: {error}'}, failed=True)
+                    print(f'Rejected {name}: {error}', flush=True)
+                    continue
+                if job['command'] == 'poster':
+                    job.setdefault('workers', 1)  # one process per job keeps the pool bounded
+                try:
+                    future = pool.submit(run_job, job)
+                except BrokenProcessPool:
+                    _requeue(dirs, name)  # a running job killed its process, the pool is replaced below
+                    break
+                print(f'Started {name}: {job["command"]}', flush=True)
+                pending[future] = (name, job, time.perf_counter())
+
+            if not pending:
+                if once:
+                    return
+                time.sleep(poll)
+                continue
+
+            finished, _ = wait(pending, timeout=poll, return_when=FIRST_COMPLETED)
+            if any(isinstance(future.exception(), BrokenProcessPool) for future in finished):
+                pool.shutdown()  # every pending job has now finished or was lost with its process
+                finished = list(pending)
+            crashed = []
+            for future in finished:
+                name, job, start = pending.pop(future)
+                result = {'job': job, 'seconds': time.perf_counter() - start}
+                try:
+                    result['outputs'] = future.result()
+                except BrokenProcessPool:
+                    crashed.append((name, job))
+                    continue
+                except Exception as error:
+                    result['error'] = f'{type(error).__name__}: {error}'
+                    print(f'Failed {name}: {result["error"]}', flush=True)
+                else:
+                    print(f'Finished {name} in {result["seconds"]:.1f} s: {", ".join(result["outputs"])}', flush=True)
+                suspects.discard(name)
+                _finish(dirs, name, result, failed='error' in result)
+
+            if crashed:
+                if len(crashed) == 1:
+                    (name, job), = crashed
+                    error = 'The process of the job died, e.g. killed for lack of memory'
+                    suspects.discard(name)
+                    _finish(dirs, name, {'job': job, 'error': error}, failed=True)
+                    print(f'Failed {name}: {error}', flush=True)
+                else:
+                    names = [name for name, _ in crashed]
+                    for name in names:
+                        suspects.add(name)
+                        _requeue(dirs, name)
+                    print(f'A process died while running {", ".join(names)}, they are queued again', flush=True)
+                pool = ProcessPoolExecutor(max_workers=jobs, initializer=_warm_worker)
+    finally:
+        pool.shutdown()
+
+
+# %% command line
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    for command, options in MOTIVE_OPTIONS.items():
+        subparser = commands.add_parser(command, help=f'render {command}, unset options keep their defaults')
+        for flag, kind, nargs, help_text in options:
+            subparser.add_argument(flag, type=kind, nargs=nargs, help=help_text, default=argparse.SUPPRESS)
+        subparser.add_argument('--output', default=argparse.SUPPRESS,
+                               help='image file, defaults to figures/<motive>/<motive>_<hash of the options>.png')
+        subparser.add_argument('--spool', help='queue the job in this spool directory instead of running it')
+
+    poster = commands.add_parser('poster', help='build posters from a manifest, see make_poster.py')
+    poster.add_argument('manifest', nargs='?', help='JSON or YAML manifest, without one the default poster is built')
+    poster.add_argument('--workers', type=int, default=argparse.SUPPRESS, help='number of processes')
+    poster.add_argument('--force', action='store_true', default=argparse.SUPPRESS, help='rebuild unchanged posters')
+    poster.add_argument('--spool', help='queue the job in this spool directory instead of running it')
+
+    worker = commands.add_parser('worker', help='render the jobs of a spool directory')
+    worker.add_argument('spool', help='spool directory, created if missing')
+    worker.add_argument('--jobs', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help='maximum number of jobs running at a time')
+    worker.add_argument('--poll', type=float, default=0.5, help='seconds between checks for new jobs')
+    worker.add_argument('--once', action='store_true', help='stop when the queue is empty')
+    return parser
+
+
+def main(argv=None):
+    args = vars(build_parser().parse_args(argv))
+    if args['command'] == 'worker':
+        return serve(args['spool'], jobs=args['jobs'], poll=args['poll'], once=args['once'])
+
+    spool = args.pop('spool')
+    job = {key: value for key, value in args.items() if value is not None}
+    if spool:
+        print(f'Queued {submit(spool, job)}')
+    else:
+        for output in run_job(job):
+            print(output)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
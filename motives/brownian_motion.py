@@ -4,18 +4,141 @@ Enable weight/skewness to the walk, favouring up or down movement.
 """
 
 import numpy as np
-import matplotlib.pyplot as plt
 from tqdm import tqdm
 
+try:
+    from motives.raster import draw_segments, tone_map, to_image
+except ModuleNotFoundError:  # run as a script from within motives/
+    from raster import draw_segments, tone_map, to_image
+
 class Brownian_motion:
 
     def __init__(self,
                  x_width: int = 10,
                  y_width: int = 10,
                  resolution: int = 1000,
+                 p_up: float = 0.5,
+                 y_start: float = 0,
+                 seed: int = None,
+                 dtype=np.float64,
                  ):
+        """
+        :param x_width: int | Length of the walks along the x-axis.
+        :param y_width: int | Height of the window the walks are drawn in, centred on y_start.
+        :param resolution: int | Number of steps of a walk.
+        :param p_up: float | Probability of a step up, 0.5 gives an unbiased walk.
+        :param y_start: float | Starting height of every walk.
+        :param seed: int | Seed for the random generator, for reproducible walks.
+        :param dtype: float64 or float32 | Type of the generated positions.
+        """
+        if resolution < 1:
+            raise ValueError(f'A walk needs a resolution of at least 1, got {resolution}')
         self.x_lim = x_width
         self.y_lim = y_width
-        self.y_start = 0
+        self.y_start = y_start
+        self.resolution = resolution
+        self.p_up = p_up
+        self.dtype = dtype
+        self.x = np.linspace(0, x_width, resolution + 1)
+        # brownian scaling, the variance after a distance x is x
+        self.step_size = np.sqrt(x_width / resolution)
+        self.rng = np.random.default_rng(seed)
+
+    def steps(self, n_walks: int, n_steps: int):
+        """
+        Draw the steps of several walks at once.
+        :param n_walks: int | Number of walks
+        :param n_steps: int | Number of steps per walk
+        :return: int8 array (n_walks, n_steps) of +1 (up) and -1 (down)
+        """
+        up = self.rng.random((n_walks, n_steps), dtype=np.float32) < self.p_up
+        steps = up.view(np.int8)
+        steps *= 2
+        steps -= 1
+        return steps
+
+    def walks(self, n_walks: int):
+        """
+        Simulate complete walks.
+        :param n_walks: int | Number of walks
+        :return: Array (n_walks, resolution + 1) with the heights at self.x, starting at y_start
+        """
+        if n_walks == 0:
+            return np.empty((0, self.resolution + 1), dtype=self.dtype)
+        return next(self.iter_chunks(n_walks, chunk_walks=n_walks, chunk_steps=self.resolution))[2]
+
+    def iter_chunks(self, n_walks: int, chunk_walks: int = 1024, chunk_steps: int = None):
+        """
+        Simulate walks in blocks of walks and steps, so very many or very long walks fit in memory.
+        Positions are accumulated as integer step counts, which keeps float32 output free of summation error.
+        Consecutive blocks of the same walks share their boundary column, so a block continues the previous one.
+        :param n_walks: int | Number of walks
+        :param chunk_walks: int | Number of walks per block
+        :param chunk_steps: int | Number of steps per block, defaults to the whole walk
+        :return: generator of (walk slice, step slice, heights array) where the heights are at
+                 self.x[step slice] for the walks in the walk slice
+        """
+        chunk_steps = self.resolution if chunk_steps is None else chunk_steps
+        for w0 in range(0, n_walks, chunk_walks):
+            w1 = min(w0 + chunk_walks, n_walks)
+            level = np.zeros(w1 - w0, dtype=np.int64)
+            for s0 in range(0, self.resolution, chunk_steps):
+                s1 = min(s0 + chunk_steps, self.resolution)
+                counts = np.empty((w1 - w0, s1 - s0 + 1), dtype=np.int64)
+                counts[:, 0] = level
+                np.cumsum(self.steps(w1 - w0, s1 - s0), axis=1, dtype=np.int64, out=counts[:, 1:])
+                counts[:, 1:] += level[:, None]
+                level = counts[:, -1]
+                heights = (self.y_start + self.step_size * counts).astype(self.dtype)
+                yield slice(w0, w1), slice(s0, s1 + 1), heights
+
+    def bounds(self):
+        """
+        :return: tuple (xmin, xmax, ymin, ymax) of the window the walks are drawn in
+        """
+        return 0, self.x_lim, self.y_start - self.y_lim / 2, self.y_start + self.y_lim / 2
+
+    def density(self, n_walks: int, width_px: int, height_px: int, chunk_walks: int = 1024, chunk_steps: int = None,
+                progress: bool = True):
+        """
+        Stream walks into a visit-density image covering x_width by y_width. Consecutive positions are joined
+        by anti-aliased segments, so the paths stay continuous however coarse the steps are compared to the
+        pixels. Every block of walks is discarded once drawn, memory depends on the image and block size only.
+        :param n_walks: int | Number of walks
+        :param width_px: int | Width of the image in pixels
+        :param height_px: int | Height of the image in pixels
+        :param chunk_walks: int | Number of walks simulated and drawn at a time
+        :param chunk_steps: int | Number of steps simulated and drawn at a time, defaults to the whole walk
+        :param progress: bool | Show a progress bar
+        :return: float array (height_px, width_px) with the path length drawn in each pixel
+        """
+        density = np.zeros((height_px, width_px))
+        bounds = self.bounds()
+        with tqdm(total=n_walks, unit='walks', disable=not progress) as pbar:
+            for walks, steps, heights in self.iter_chunks(n_walks, chunk_walks=chunk_walks, chunk_steps=chunk_steps):
+                x = np.broadcast_to(self.x[steps], heights.shape)
+                draw_segments(density, x[:, :-1].ravel(), heights[:, :-1].ravel(),
+                              x[:, 1:].ravel(), heights[:, 1:].ravel(), bounds)
+                if steps.stop == self.resolution + 1:
+                    pbar.update(walks.stop - walks.start)
+        return density
+
+    def render_density(self, n_walks: int, width_px: int, height_px: int, method: str = 'log', gamma: float = 0.5,
+                       **kwargs):
+        """
+        Render many walks as a tone-mapped density image instead of one line per walk.
+        :param method: str | Tone mapping, 'log' or 'gamma'
+        :param gamma: float | Exponent of the 'gamma' tone mapping
+        :param kwargs: Passed on to density
+        :return: uint8 array (height_px, width_px), dark paths on white, ready for raster.to_image
+        """
+        return tone_map(self.density(n_walks, width_px, height_px, **kwargs), method=method, gamma=gamma)
+
 
+if __name__ == '__main__':
+    bm = Brownian_motion(x_width=10, y_width=10, resolution=1000, p_up=0.52, seed=0)
 
+    # density of many paths at 30 x 20 cm and 300 dpi, instead of one line per walk
+    n_walks = 20000
+    image = bm.render_density(n_walks=n_walks, width_px=int(30 / 2.54 * 300), height_px=int(20 / 2.54 * 300))
+    to_image(image).save(f'../figures/brownian_motion/brownian_motion_walks{n_walks}_pup{bm.p_up}.png', format='png')
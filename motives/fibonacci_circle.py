@@ -6,15 +6,49 @@ Motive
     So, the first number which is 0 would be translated to 0.00.
     Number 2 would be 0.01. Number 8 which is 13 would be 0.13.
     Connecting the adjacent numbers in the sequence will make the pattern emerge.
+    Other sequences (Lucas numbers, powers of 2, primes) and mappings (digits modulo m, residues)
+    are available through SEQUENCES and MAPPINGS, see mapped_sequence.
 
 13/8 2025
 @karlwennerstrom
 """
 
 # Imports
+import decimal as dec
+import itertools
+import math
+
 import numpy as np
 from tqdm import tqdm
-import matplotlib.pyplot as plt
+
+try:
+    from motives.raster import draw_segments, tone_map, to_image
+    from motives.render_cache import cache_key, default_cache
+except ModuleNotFoundError:  # run as a script from within motives/
+    from raster import draw_segments, tone_map, to_image
+    from render_cache import cache_key, default_cache
+
+
+def _split(value: dec.Decimal):
+    """
+    Split a constant into a coarse float, whose product with an integer k < 2^23 is exact, and a small remainder.
+    :param value: Decimal | The constant with more precision than a float
+    :return: tuple of floats (hi, lo) with hi + lo = value
+    """
+    hi = math.floor(float(value) * 2 ** 30) / 2 ** 30
+    return hi, float(value - dec.Decimal(hi))
+
+
+# logarithms for the closed forms of the sequences, from 50-digit arithmetic
+with dec.localcontext() as _ctx:
+    _ctx.prec = 50
+    _SQRT5 = dec.Decimal(5).sqrt()
+    LOG10_PHI_HI, LOG10_PHI_LO = _split(((1 + _SQRT5) / 2).log10())
+    LOG10_2_HI, LOG10_2_LO = _split(dec.Decimal(2).log10())
+    LOG10_SQRT5 = float(_SQRT5.log10())
+
+# terms below this position are computed exactly, closed forms are used above
+EXACT_BELOW = 100
 
 
 # The fibonacci series as a generator
@@ -43,38 +77,298 @@ def leading_three_digits(num: int):
     return f_num
 
 
-def get_circle_position(num: float):
+def fibonacci_pair(k: int):
+    """
+    F(k) and F(k+1) by fast doubling, F(2m) = F(m)(2F(m+1) - F(m)), F(2m+1) = F(m)^2 + F(m+1)^2
+    :param k: int | Position in the sequence, F(0) = 0
+    :return: tuple of ints (F(k), F(k+1))
+    """
+    a, b = 0, 1  # F(m), F(m+1)
+    for bit in bin(k)[2:]:
+        a, b = a * (2 * b - a), a * a + b * b
+        if bit == '1':
+            a, b = b, a + b
+    return a, b
+
+
+def fibonacci_number(k: int):
+    """
+    :param k: int | Position in the sequence, F(0) = 0
+    :return: int | The k-th fibonacci number
+    """
+    return fibonacci_pair(k)[0]
+
+
+def lucas_sequence(n: int):
+    """
+    The Lucas numbers 2, 1, 3, 4, 7, ... as a generator
+    :param n: int | The length of the sequence
+    """
+    a, b = 2, 1
+    for _ in range(n):
+        yield a
+        a, b = b, a + b
+
+
+def lucas_number(k: int):
+    """
+    :param k: int | Position in the sequence, L(0) = 2
+    :return: int | The k-th Lucas number, L(k) = 2F(k+1) - F(k)
+    """
+    a, b = fibonacci_pair(k)
+    return 2 * b - a
+
+
+def powers_of_two(n: int):
+    """
+    1, 2, 4, 8, ... as a generator
+    :param n: int | The length of the sequence
+    """
+    for k in range(n):
+        yield 2 ** k
+
+
+def prime_numbers(n: int):
+    """
+    The first n primes, with a sieve of Eratosthenes.
+    :param n: int | The length of the sequence
+    :return: int64 array (n,)
+    """
+    # the n-th prime is below n (ln n + ln ln n) for n >= 6
+    limit = max(15, int(n * (math.log(max(n, 2)) + math.log(math.log(max(n, 3))))) + 1)
+    sieve = np.ones(limit + 1, dtype=bool)
+    sieve[:2] = False
+    for p in range(2, math.isqrt(limit) + 1):
+        if sieve[p]:
+            sieve[p * p::p] = False
+    return np.flatnonzero(sieve)[:n].astype(np.int64)
+
+
+def recurrence_residues(a: int, b: int, n: int, modulus: int):
+    """
+    Residues of the recurrence x(k+2) = x(k+1) + x(k) without growing integers.
+    :param a: int | x(0)
+    :param b: int | x(1)
+    :param n: int | The length of the sequence
+    :param modulus: int | The modulus
+    :return: int64 array (n,) with x(k) mod modulus
+    """
+    residues = np.empty(n, dtype=np.int64)
+    a, b = a % modulus, b % modulus
+    for k in range(n):
+        residues[k] = a
+        a, b = b, (a + b) % modulus
+    return residues
+
+
+def fraction_of_multiple(k, hi: float, lo: float, offset: float = 0.0):
+    """
+    Fractional part of k (hi + lo) + offset, keeping the precision of the fraction for large k.
+    :param k: Array of integer-valued floats below 2^23
+    :return: Array of floats in [0, 1)
+    """
+    return np.mod(np.mod(k * hi, 1) + (k * lo + offset), 1)
+
+
+def leading_digits_exact(num: int, digits: int = 3):
+    """
+    Same as leading_three_digits for any number of digits, without converting the whole number to a string.
+    :param num: int | A non-negative number
+    :param digits: int | Number of leading digits
+    :return: float between 0-10
+    """
+    if num < 10 ** digits:
+        return num / 10 ** (digits - 1)
+    shift = max(int(num.bit_length() * math.log10(2)) - digits - 1, 0)
+    head = num // 10 ** shift
+    while head >= 10 ** digits:
+        head //= 10
+    return head / 10 ** (digits - 1)
+
+
+# %% sequences
+
+SEQUENCES = {}
+
+
+def register_sequence(name: str, terms, term=None, log10_fraction=None, residues=None):
+    """
+    Make a sequence available to the mappings.
+    :param name: str | Name of the sequence
+    :param terms: function n -> iterable of the first n terms as ints
+    :param term: function k -> the k-th term, defaults to iterating terms
+    :param log10_fraction: function k -> fractional part of log10 of the k-th term, for an array of k.
+                           Enables leading digits without computing the terms.
+    :param residues: function (n, modulus) -> int64 array of the first n terms mod modulus
+    """
+    SEQUENCES[name] = {'terms': terms,
+                       'term': term or (lambda k: next(itertools.islice(terms(k + 1), k, None))),
+                       'log10_fraction': log10_fraction,
+                       'residues': residues or (lambda n, modulus: np.fromiter((t % modulus for t in terms(n)),
+                                                                               dtype=np.int64, count=n))}
+
+
+register_sequence('fibonacci', fibonacci_sequence, term=fibonacci_number,
+                  log10_fraction=lambda k: fraction_of_multiple(k, LOG10_PHI_HI, LOG10_PHI_LO, -LOG10_SQRT5),
+                  residues=lambda n, modulus: recurrence_residues(0, 1, n, modulus))
+register_sequence('lucas', lucas_sequence, term=lucas_number,
+                  log10_fraction=lambda k: fraction_of_multiple(k, LOG10_PHI_HI, LOG10_PHI_LO),
+                  residues=lambda n, modulus: recurrence_residues(2, 1, n, modulus))
+register_sequence('powers_of_two', powers_of_two, term=lambda k: 2 ** k,
+                  log10_fraction=lambda k: fraction_of_multiple(k, LOG10_2_HI, LOG10_2_LO),
+                  residues=lambda n, modulus: np.array([pow(2, k, modulus) for k in range(n)], dtype=np.int64))
+register_sequence('primes', lambda n: (int(p) for p in prime_numbers(n)), term=lambda k: int(prime_numbers(k + 1)[k]),
+                  log10_fraction=lambda k: np.mod(np.log10(prime_numbers(int(k[-1]) + 1)[k.astype(int)]), 1),
+                  residues=lambda n, modulus: prime_numbers(n) % modulus)
+
+
+# %% mappings
+
+def leading_digits(sequence: str, n: int, digits: int = 3):
+    """
+    leading_three_digits for any sequence and number of digits, vectorised where the sequence has a closed form.
+    log10 of the k-th term has fractional part f, so the leading digits are floor(10^(f + digits - 1)).
+    Small k, and the rare k where 10^(f + digits - 1) is too close to an integer to decide the rounding,
+    are computed exactly.
+    :param sequence: str | Name of a registered sequence
+    :param n: int | The length of the sequence
+    :param digits: int | Number of leading digits
+    :return: Array (n,) of floats between 0-10
+    """
+    seq = SEQUENCES[sequence]
+    values = np.empty(n)
+    n_exact = n if seq['log10_fraction'] is None else min(n, EXACT_BELOW)
+    for k, num in enumerate(itertools.islice(seq['terms'](n), n_exact)):
+        values[k] = leading_digits_exact(num, digits)
+    if n <= n_exact:
+        return values
+
+    k = np.arange(n_exact, n, dtype=float)
+    mantissa = 10 ** (seq['log10_fraction'](k) + digits - 1)  # between 10^(digits-1) and 10^digits
+    values[n_exact:] = np.floor(mantissa) / 10 ** (digits - 1)
+
+    ambiguous = np.abs(mantissa - np.rint(mantissa)) < 1e-9
+    for k_ambiguous in k[ambiguous].astype(int):
+        values[k_ambiguous] = leading_digits_exact(seq['term'](int(k_ambiguous)), digits)
+    return values
+
+
+def digit_mod(sequence: str, n: int, position: int = 0, modulus: int = 10):
+    """
+    A digit of each term, counted from the right, modulo a number.
+    :param sequence: str | Name of a registered sequence
+    :param n: int | The length of the sequence
+    :param position: int | 0 is the last digit, 1 the second to last, ...
+    :param modulus: int | The digit is taken modulo this number
+    :return: int64 array (n,) with values between 0 and modulus - 1
+    """
+    residues = SEQUENCES[sequence]['residues'](n, 10 ** (position + 1))
+    return (residues // 10 ** position) % modulus
+
+
+def residue(sequence: str, n: int, modulus: int = 10):
+    """
+    Each term modulo a number.
+    :param sequence: str | Name of a registered sequence
+    :param n: int | The length of the sequence
+    :param modulus: int | The modulus
+    :return: int64 array (n,) with values between 0 and modulus - 1
+    """
+    return SEQUENCES[sequence]['residues'](n, modulus)
+
+
+# name -> (mapping, number of ticks on the circle given the parameters)
+MAPPINGS = {'leading_digits': (leading_digits, lambda digits=3: 10),
+            'digit_mod': (digit_mod, lambda position=0, modulus=10: modulus),
+            'residue': (residue, lambda modulus=10: modulus)}
+
+
+def fibonacci_leading_digits(n: int):
+    """
+    leading_three_digits of the first n fibonacci numbers, without computing the numbers.
+    :param n: int | The length of the sequence
+    :return: Array (n,) of floats between 0-10
+    """
+    return leading_digits('fibonacci', n, digits=3)
+
+
+def mapped_sequence(sequence: str, mapping: str, n: int, cache: bool = True, **params):
+    """
+    Map the first n terms of a sequence to positions on a circle, cached in the render cache.
+    The longest computed run of the same sequence, mapping and parameters is kept, and reused for any n up to it.
+    :param sequence: str | Name of a registered sequence
+    :param mapping: str | Name of a mapping in MAPPINGS
+    :param n: int | The length of the sequence
+    :param cache: bool | Consult and fill the render cache
+    :param params: Parameters of the mapping
+    :return: tuple (array (n,) of positions, number of ticks on the circle)
+    """
+    function, ticks = MAPPINGS[mapping]
+    ticks = ticks(**params)
+    if not cache:
+        return function(sequence, n, **params), ticks
+
+    # the length is left out of the key, a run serves every shorter request
+    render_cache = default_cache()
+    key = cache_key('mapped_sequence', {'sequence': sequence, 'mapping': mapping, 'params': params}, (__file__,))
+    cached = render_cache.load(key)
+    if cached is not None and len(cached['values']) >= n:
+        return cached['values'][:n].copy(), ticks
+
+    values = function(sequence, n, **params)
+    render_cache.save(key, values=values)
+    return values, ticks
+
+
+def get_circle_position(num: float, max_num: float = 10.0):
     """
     Find the coordinates for a number between 0-10 on the circle with radius 1.
     Starting from the positive x-axis going counterclockwise.
-    :param num: float | Three digit number between 0 and 10.
+    :param num: float or array | Three digit number between 0 and 10, or an array of them.
+    :param max_num: float | Number of ticks on the circle, the value that maps back to the start
     :return: x- and y-coordinates on the circle
     """
     # Convert the number to radians
-    max_num = 10.0
     num = num * (2 * np.pi) / max_num
     x, y = np.cos(num), np.sin(num)
     return x, y
 
 
+def render_chords(xs, ys, size_px: int, line_weight: float = 1.0, circle_weight: float = 1.0,
+                  method: str = 'log', gamma: float = 0.5):
+    """
+    Rasterise the chords between consecutive circle positions into a square density image.
+    Overlapping chords accumulate, and the tone mapping keeps both sparse and dense regions visible.
+    The positions only take a limited number of values, so repeated chords are drawn once with their count.
+    :param xs: Array (n,) | x-coordinates of the positions on the circle
+    :param ys: Array (n,) | y-coordinates of the positions on the circle
+    :param size_px: int | Width and height of the image in pixels
+    :param line_weight: float | Ink per pixel of chord length
+    :param circle_weight: float | Ink per pixel of the circle itself, 0 leaves the circle out
+    :param method: str | Tone mapping, 'log' or 'gamma'
+    :param gamma: float | Exponent of the 'gamma' tone mapping
+    :return: uint8 array (size_px, size_px), dark lines on white, ready for raster.to_image
+    """
+    bounds = (-1.02, 1.02, -1.02, 1.02)
+    density = np.zeros((size_px, size_px))
+    xs, ys = np.asarray(xs), np.asarray(ys)
+    chords, counts = np.unique(np.column_stack([xs[:-1], ys[:-1], xs[1:], ys[1:]]), axis=0, return_counts=True)
+    draw_segments(density, *chords.T, bounds, weight=line_weight * counts)
+    if circle_weight > 0:
+        angles = np.linspace(0, 2 * np.pi, 4 * size_px)
+        cx, cy = np.cos(angles), np.sin(angles)
+        draw_segments(density, cx[:-1], cy[:-1], cx[1:], cy[1:], bounds, weight=circle_weight)
+    return tone_map(density, method=method, gamma=gamma)
+
+
 if __name__ == '__main__':
-    n = 1000
-    fib_generator = fibonacci_sequence(n)
-
-    xs, ys = [], []
-    for num in fib_generator:
-        scaled_num = leading_three_digits(num)
-        x,y = get_circle_position(scaled_num)
-        xs.append(x)
-        ys.append(y)
-        #print(f'Number: {num}')
-        #print(f'Coords: {x, y}')
-
-    plt.figure()
-    # Create circle
-    x = np.linspace(0, 2*np.pi, 1000)
-    plt.plot(np.cos(x), np.sin(x), linewidth=0.1, c='k')
-    plt.plot(xs, ys, linewidth=0.05, c='y')
-    plt.title(f'Fibonacci circle with n={n}')
-    plt.axis('scaled')  # Equally scaled axes
-    plt.show()
+    n = int(1e6)
+
+    # all positions at once, loaded from the cache on repeated renders
+    scaled_nums, ticks = mapped_sequence('fibonacci', 'leading_digits', n, digits=3)
+    xs, ys = get_circle_position(scaled_nums, max_num=ticks)
+
+    # chords accumulated at poster resolution, 30 cm at 300 dpi
+    size_px = int(30 / 2.54 * 300)
+    image = render_chords(xs, ys, size_px=size_px)
+    to_image(image).save(f'../figures/fibonacci_circle/fibonacci_circle_n{n}.png', format='png')
@@ -0,0 +1,192 @@
+"""
+Iterated function systems
+    Fractals as the attractor of a set of affine maps x -> A x + b, where every step applies a randomly
+    chosen map to the current point. The Sierpinski triangle, n-gon chaos games and the Barnsley fern
+    are presets. Instead of following a single point, many independent walkers are moved at once so
+    every step is a handful of array operations, and the points are binned into a density image.
+"""
+
+import numpy as np
+from tqdm import tqdm
+
+try:
+    from motives.raster import accumulate_density, tone_map
+except ModuleNotFoundError:  # run as a script from within motives/
+    from raster import accumulate_density, tone_map
+
+
+class IFS:
+
+    def __init__(self, matrices, offsets, probabilities=None, transitions=None, seed=None):
+        """
+        :param matrices: Array (m, 2, 2) | The linear part A of each map
+        :param offsets: Array (m, 2) | The translation b of each map
+        :param probabilities: Array (m,) | Probability of choosing each map, uniform by default
+        :param transitions: Array (m, m) | Optional probability of choosing map j right after map i,
+                                           e.g. a zero diagonal forbids choosing the same vertex twice.
+                                           Replaces probabilities after the first step.
+        :param seed: int or np.random.SeedSequence | Seed for the generator
+        """
+        self.matrices = np.asarray(matrices, dtype=float)
+        self.offsets = np.asarray(offsets, dtype=float)
+        n_maps = len(self.matrices)
+        if self.matrices.shape != (n_maps, 2, 2) or self.offsets.shape != (n_maps, 2):
+            raise ValueError('Expected matrices of shape (m, 2, 2) and offsets of shape (m, 2)')
+
+        probabilities = np.full(n_maps, 1 / n_maps) if probabilities is None else np.asarray(probabilities, dtype=float)
+        self.probabilities = probabilities / probabilities.sum()
+        self.transitions = None
+        if transitions is not None:
+            transitions = np.asarray(transitions, dtype=float)
+            self.transitions = transitions / transitions.sum(axis=1, keepdims=True)
+        self.rng = np.random.default_rng(seed)
+
+    @classmethod
+    def from_vertices(cls, vertices, ratio: float = 0.5, **kwargs):
+        """
+        Chaos game on a polygon, every step moves the given ratio of the way towards a random vertex.
+        :param vertices: Array (m, 2) | The vertices of the polygon
+        :param ratio: float | Fraction of the distance to the vertex covered in a step
+        :return: IFS
+        """
+        vertices = np.asarray(vertices, dtype=float)
+        matrices = np.repeat((1 - ratio) * np.eye(2)[None], len(vertices), axis=0)
+        return cls(matrices, ratio * vertices, **kwargs)
+
+    @classmethod
+    def sierpinski(cls, corners, **kwargs):
+        """
+        The Sierpinski triangle, move halfway to a random corner.
+        :param corners: Array (3, 2) | The corners of the triangle
+        :return: IFS
+        """
+        return cls.from_vertices(corners, ratio=0.5, **kwargs)
+
+    @classmethod
+    def ngon(cls, n: int, ratio: float = 0.5, restricted: bool = False, **kwargs):
+        """
+        Chaos game on a regular n-gon inscribed in the unit circle.
+        :param n: int | Number of vertices
+        :param ratio: float | Fraction of the distance to the vertex covered in a step
+        :param restricted: bool | Never choose the same vertex twice in a row
+        :return: IFS
+        """
+        angles = np.pi / 2 + 2 * np.pi * np.arange(n) / n
+        vertices = np.stack([np.cos(angles), np.sin(angles)], axis=1)
+        if restricted:
+            kwargs['transitions'] = 1 - np.eye(n)
+        return cls.from_vertices(vertices, ratio=ratio, **kwargs)
+
+    @classmethod
+    def barnsley_fern(cls, **kwargs):
+        """
+        The Barnsley fern.
+        :return: IFS
+        """
+        matrices = [[[0, 0], [0, 0.16]],
+                    [[0.85, 0.04], [-0.04, 0.85]],
+                    [[0.2, -0.26], [0.23, 0.22]],
+                    [[-0.15, 0.28], [0.26, 0.24]]]
+        offsets = [[0, 0], [0, 1.6], [0, 1.6], [0, 0.44]]
+        return cls(matrices, offsets, probabilities=[0.01, 0.85, 0.07, 0.07], **kwargs)
+
+    def choose_maps(self, previous=None, size: int = None):
+        """
+        Draw the next map for every walker.
+        :param previous: int array | The map each walker applied last, only used with transitions
+        :param size: int | Number of walkers
+        :return: int array with a map index per walker
+        """
+        if self.transitions is None or previous is None:
+            return self.rng.choice(len(self.matrices), size=size, p=self.probabilities)
+        cumulative = np.cumsum(self.transitions, axis=1)[previous]
+        u = self.rng.random(len(previous))
+        return np.minimum((u[:, None] >= cumulative).sum(axis=1), len(self.matrices) - 1)
+
+    def step(self, points, maps):
+        """
+        Apply the chosen map to every point, grouped by map.
+        :param points: Array (w, 2) | Current points of the walkers
+        :param maps: int array (w,) | The map to apply to each point
+        :return: Array (w, 2) with the new points
+        """
+        new_points = np.empty_like(points)
+        for k, (matrix, offset) in enumerate(zip(self.matrices, self.offsets)):
+            selected = maps == k
+            new_points[selected] = points[selected] @ matrix.T + offset
+        return new_points
+
+    def stream(self, n: int, walkers: int = 2 ** 16, burn_in: int = 30):
+        """
+        Generate n points of the attractor, one step of all walkers at a time.
+        The walkers start at random points and their first burn_in steps are discarded.
+        :param n: Number of points
+        :param walkers: int | Number of independent walkers
+        :param burn_in: int | Steps before the walkers are on the attractor
+        :return: generator of arrays (m, 2) with m <= walkers
+        """
+        points = self.rng.random((walkers, 2))
+        maps = None
+        for _ in range(burn_in):
+            maps = self.choose_maps(maps, size=walkers)
+            points = self.step(points, maps)
+
+        for start in range(0, n, walkers):
+            maps = self.choose_maps(maps, size=walkers)
+            points = self.step(points, maps)
+            yield points[:n - start]
+
+    def estimate_bounds(self, n: int = 2 ** 16, margin: float = 0.02):
+        """
+        :param n: Number of sample points
+        :param margin: float | Padding added on each side, relative to the extent
+        :return: tuple (xmin, xmax, ymin, ymax) enclosing the attractor
+        """
+        sample = np.concatenate(list(self.stream(n, walkers=min(n, 2 ** 12))))
+        (xmin, ymin), (xmax, ymax) = sample.min(axis=0), sample.max(axis=0)
+        dx, dy = margin * (xmax - xmin), margin * (ymax - ymin)
+        return float(xmin - dx), float(xmax + dx), float(ymin - dy), float(ymax + dy)
+
+    def density(self, n: int, width_px: int, height_px: int, bounds: tuple = None, walkers: int = 2 ** 16,
+                burn_in: int = 30, progress: bool = True):
+        """
+        Bin n points of the attractor into a count image, memory does not grow with n.
+        :param n: Number of points
+        :param width_px: int | Width of the image in pixels
+        :param height_px: int | Height of the image in pixels
+        :param bounds: tuple | (xmin, xmax, ymin, ymax) covered by the image, estimated by default
+        :param walkers: int | Number of independent walkers
+        :param burn_in: int | Steps before the walkers are on the attractor
+        :param progress: bool | Show a progress bar
+        :return: int64 array (height_px, width_px) with the number of points per pixel
+        """
+        bounds = self.estimate_bounds() if bounds is None else bounds
+        counts = np.zeros((height_px, width_px), dtype=np.int64)
+        with tqdm(total=n, unit='points', disable=not progress) as pbar:
+            for chunk in self.stream(n, walkers=walkers, burn_in=burn_in):
+                accumulate_density(counts, chunk, bounds)
+                pbar.update(len(chunk))
+        return counts
+
+    def rasterise(self, n: int, width_px: int, height_px: int, method: str = 'log', gamma: float = 0.5,
+                  bounds: tuple = None, **kwargs):
+        """
+        Render n points of the attractor as a tone-mapped density image.
+        :param method: str | Tone mapping, 'log' or 'gamma'
+        :param gamma: float | Exponent of the 'gamma' tone mapping
+        :return: uint8 array (height_px, width_px), dark points on white, ready for raster.to_image
+        """
+        return tone_map(self.density(n, width_px, height_px, bounds=bounds, **kwargs), method=method, gamma=gamma)
+
+
+if __name__ == '__main__':
+    try:
+        from motives.raster import to_image
+    except ModuleNotFoundError:
+        from raster import to_image
+
+    fern = IFS.barnsley_fern(seed=0)
+    to_image(fern.rasterise(n=int(1e7), width_px=1200, height_px=2000)).save('barnsley_fern.png', format='png')
+
+    pentagon = IFS.ngon(5, ratio=0.5, restricted=True, seed=0)
+    to_image(pentagon.rasterise(n=int(1e7), width_px=1600, height_px=1600)).save('pentagon_restricted.png', format='png')
@@ -1,7 +1,48 @@
+import copy
+import functools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
 import numpy as np
-import matplotlib.pyplot as plt
 from tqdm import tqdm
 
+try:
+    from motives.raster import apply_colormap, to_image
+    from motives.render_cache import cache_key, default_cache
+except ModuleNotFoundError:  # run as a script from within motives/
+    from raster import apply_colormap, to_image
+    from render_cache import cache_key, default_cache
+
+
+@functools.lru_cache(maxsize=None)
+def polynomial_roots(coefficients: tuple):
+    """
+    Roots of a polynomial, cached so renders of the same polynomial only solve it once.
+    :param coefficients: tuple | Polynomial coefficients, highest degree first
+    :return: tuple of complex roots
+    """
+    return tuple(complex(root) for root in np.roots(coefficients))
+
+
+def horner(coefficients: tuple, z, out=None):
+    """
+    Evaluate a polynomial with Horner's scheme in a single pass over z.
+    :param coefficients: tuple | Polynomial coefficients, highest degree first
+    :param z: Complex numbers representing coordinates in the complex plane
+    :param out: Complex array of the same size as z receiving the result, must not overlap z
+    :return: The polynomial evaluated at z
+    """
+    if out is None:
+        out = np.empty_like(z, dtype=complex)
+    out.fill(coefficients[0])
+    for c in coefficients[1:]:
+        np.multiply(out, z, out=out)
+        np.add(out, c, out=out)
+    return out
+
 
 class Newton_fractals:
 
@@ -12,6 +53,7 @@ class Newton_fractals:
                  resolution: int = 1000,
                  max_basins_iter: int = 50,
                  tolerance: float = 1e-6,
+                 coefficients: tuple = None,
                  ):
         """
         :param polynomial_degree: int | Degree of the polynomial function.
@@ -20,7 +62,18 @@ class Newton_fractals:
         :param resolution: int | The resolution of the grid.
         :param max_basins_iter: int | Max_basinsimum number of iterations for Newton's method.
         :param tolerance: float | Tolerance for convergence.
+        :param coefficients: tuple | Coefficients of an arbitrary polynomial, highest degree first.
+                                     Replaces z^polynomial_degree - 1 when given.
         """
+        self.coefficients = None
+        self.derivative_coefficients = None
+        if coefficients is not None:
+            coefficients = tuple(np.trim_zeros(np.asarray(coefficients, dtype=complex), 'f').tolist())
+            if len(coefficients) < 2:
+                raise ValueError('The polynomial needs a degree of at least 1')
+            self.coefficients = coefficients
+            self.derivative_coefficients = tuple(np.polyder(np.array(coefficients)).tolist())
+            polynomial_degree = len(coefficients) - 1
         self.degree = polynomial_degree
         self.x = np.linspace(x_lim[0], x_lim[1], resolution)
         self.y = np.linspace(y_lim[0], y_lim[1], resolution)
@@ -31,13 +84,17 @@ class Newton_fractals:
         self.iterations = None
 
     def compute_roots(self):
+        if self.coefficients is not None:
+            return list(polynomial_roots(self.coefficients))
         return [np.exp(2j * np.pi * i / self.degree) for i in range(self.degree)]
 
     def f(self, z):
         """
         :param z: Complex numbers representing coordinates in the complex plane
-        :return: The polynomial z^x - 1
+        :return: The polynomial z^x - 1, or the polynomial given by the coefficients
         """
+        if self.coefficients is not None:
+            return horner(self.coefficients, z)
         return z ** self.degree - 1
 
     def df(self, z):
@@ -45,39 +102,425 @@ class Newton_fractals:
         :param z: Complex numbers representing coordinates in the complex plane
         :return: The derivative of the polynomial
         """
+        if self.coefficients is not None:
+            return horner(self.derivative_coefficients, z)
         return self.degree * z ** (self.degree - 1)
 
-    def compute(self):
+    def compute(self, engine: str = 'active', cache: bool = True, observer=None):
         """
         Generate Newton's fractals for a given polynomial and its derivative.
         Converge tuple of array (attraction basin indices, number of iterations to converge).
+        :param engine: str | 'active' only iterates the pixels that have not settled on a root yet,
+                             'dense' iterates the full grid in every step.
+        :param cache: bool | Reuse the result of an earlier compute with the same parameters from the render cache,
+                             both engines give the same result
+        :param observer: callable | Called with the statistics of every iteration of the active engine, see
+                                    _compute_active, and stops the iteration by returning True.
+                                    The render cache is bypassed when given, an observed run may stop early.
         """
+        if engine not in ('active', 'dense'):
+            raise ValueError(f'Unknown engine {engine!r}, expected "active" or "dense"')
+        if observer is not None and engine != 'active':
+            raise ValueError('An observer needs the "active" engine')
         if self.roots is None:
             print('Computing roots...')
-            self.compute_roots()
+            self.roots = self.compute_roots()
             print('Done!')
 
+        render_cache = default_cache() if cache and observer is None else None
+        key = cache_key('Newton_fractals.compute', self.cache_params(), (__file__,))
+        cached = render_cache.load(key) if render_cache is not None else None
+        if cached is not None:
+            self.basin, self.iterations = cached['basin'], cached['iterations']
+            return
+
         X, Y = np.meshgrid(self.x, self.y)
         Z = X + 1j * Y
 
-        self.basin = np.zeros(Z.shape, dtype=int)
-        self.iterations = np.zeros(Z.shape, dtype=int)
+        if engine == 'active':
+            self.basin, self.iterations = self._compute_active(Z, observer=observer)
+        else:
+            self.basin, self.iterations = self._compute_dense(Z)
+
+        if render_cache is not None:
+            render_cache.save(key, basin=self.basin, iterations=self.iterations)
+
+        # return basin, iterations
+
+    def _compute_dense(self, Z):
+        """
+        Newton iteration over the full grid, every pixel is updated in every iteration.
+        :param Z: Complex grid of starting points
+        :return: tuple of arrays (basin, iterations) with the shape of Z
+        """
+        basin = np.zeros(Z.shape, dtype=int)
+        iterations = np.zeros(Z.shape, dtype=int)
 
         for i in tqdm(range(self.max_basins_iter), desc='Iterations'):
             Z_prev = Z
             Z = Z - self.f(Z) / self.df(Z)
             converged = np.abs(Z - Z_prev) < self.tolerance  # not changing
-            not_assigned = (self.basin == 0)
+            not_assigned = (basin == 0)
             newly_converged = converged & not_assigned
-            self.iterations[newly_converged] = i
-            for root_idx, root in enumerate(self.roots, start=1):
-                is_root = np.abs(Z - root) < self.tolerance
-                self.basin[is_root & newly_converged] = root_idx
+            iterations[newly_converged] = i
+            basin[newly_converged] = self.classify(Z[newly_converged])  # nearest root, as in the active engine
 
             if np.all(converged):
                 break
 
-        # return basin, iterations
+        return basin, iterations
+
+    def compute_tiled(self, out_dir: str, tile_size: int = 1024, resume: bool = True):
+        """
+        Out-of-core version of compute. The complex plane is processed in blocks of tile_size x tile_size
+        pixels and the results are written to memory-mapped .npy files, so peak memory depends on the
+        tile size and not on the resolution. Finished tiles are recorded in out_dir/progress.json and
+        skipped when an interrupted render is restarted.
+        :param out_dir: str | Directory for basin.npy, iterations.npy and progress.json
+        :param tile_size: int | Number of rows and columns in a tile
+        :param resume: bool | Continue from the finished tiles of a previous run with the same parameters
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        basin_path = os.path.join(out_dir, 'basin.npy')
+        iterations_path = os.path.join(out_dir, 'iterations.npy')
+        progress_path = os.path.join(out_dir, 'progress.json')
+        shape = (self.y.size, self.x.size)
+        params = self._tiled_params(tile_size)
+
+        done = set()
+        if resume and os.path.exists(progress_path):
+            with open(progress_path) as fp:
+                progress = json.load(fp)
+            if progress['params'] != params:
+                raise ValueError(f'{out_dir} holds a render with other parameters, use resume=False to overwrite it')
+            done = set(progress['done'])
+            basin = np.lib.format.open_memmap(basin_path, mode='r+')
+            iterations = np.lib.format.open_memmap(iterations_path, mode='r+')
+        else:
+            basin = np.lib.format.open_memmap(basin_path, mode='w+', dtype=int, shape=shape)
+            iterations = np.lib.format.open_memmap(iterations_path, mode='w+', dtype=int, shape=shape)
+
+        todo = [(tile_idx, tile) for tile_idx, tile in enumerate(self._tiles(tile_size)) if tile_idx not in done]
+        for tile_idx, (r0, r1, c0, c1) in tqdm(todo, desc='Tiles', initial=len(done), total=len(done) + len(todo)):
+            X, Y = np.meshgrid(self.x[c0:c1], self.y[r0:r1])
+            basin[r0:r1, c0:c1], iterations[r0:r1, c0:c1] = self._compute_active(X + 1j * Y, progress=False)
+            basin.flush()
+            iterations.flush()
+
+            # record the tile only once its results are on disk
+            done.add(tile_idx)
+            with open(progress_path + '.tmp', 'w') as fp:
+                json.dump({'params': params, 'done': sorted(done)}, fp)
+            os.replace(progress_path + '.tmp', progress_path)
+
+        del basin, iterations
+        self.basin = np.load(basin_path, mmap_mode='r')
+        self.iterations = np.load(iterations_path, mmap_mode='r')
+
+    def compute_parallel(self, workers: int = None, tile_size: int = 512):
+        """
+        Multi-core version of compute. The grid is split into tiles which are computed by a process pool.
+        The workers write straight into shared memory, so only tile coordinates and timings are pickled.
+        :param workers: int | Number of worker processes, defaults to the number of cores
+        :param tile_size: int | Number of rows and columns in a tile
+        :return: list of dicts with the tile bounds, the worker pid and the seconds spent on each tile
+        """
+        shape = (self.y.size, self.x.size)
+        nbytes = int(np.prod(shape)) * np.dtype(int).itemsize
+        basin_shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        iterations_shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        try:
+            # the workers only need the parameters, not results of earlier renders
+            nf = copy.copy(self)
+            nf.basin = nf.iterations = None
+
+            tile_timings = []
+            with ProcessPoolExecutor(max_workers=workers,
+                                     initializer=_init_tile_worker,
+                                     initargs=(nf, basin_shm.name, iterations_shm.name, shape)) as pool:
+                futures = [pool.submit(_compute_tile_shared, tile) for tile in self._tiles(tile_size)]
+                for future in tqdm(as_completed(futures), total=len(futures), desc='Tiles'):
+                    tile_timings.append(future.result())
+
+            self.basin = np.ndarray(shape, dtype=int, buffer=basin_shm.buf).copy()
+            self.iterations = np.ndarray(shape, dtype=int, buffer=iterations_shm.buf).copy()
+        finally:
+            for shm in (basin_shm, iterations_shm):
+                shm.close()
+                shm.unlink()
+
+        self.tile_timings = sorted(tile_timings, key=lambda timing: timing['tile'])
+        return self.tile_timings
+
+    def compute_progressive(self, steps: tuple = (16, 4, 1), skip_uniform: bool = True):
+        """
+        Coarse-to-fine preview of compute. Level k samples every steps[k]-th row and column of the grid,
+        samples already computed on a coarser level are reused. With skip_uniform, the pixels inside a coarse
+        cell whose four corners converged to the same root in the same number of iterations are filled
+        from the corners instead of iterated, so the finest level is an approximation of compute.
+        The arrays of the latest level are also stored in self.basin and self.iterations.
+        :param steps: tuple | Decreasing sampling strides, each one dividing the previous one
+        :param skip_uniform: bool | Fill uniform coarse cells instead of computing them
+        :return: generator of (step, basin, iterations) with arrays of the level's size
+        """
+        if any(coarse % fine for coarse, fine in zip(steps, steps[1:])) or list(steps) != sorted(steps, reverse=True):
+            raise ValueError(f'Steps {steps} must be decreasing and divide each other')
+
+        coarse_step = None
+        for step in steps:
+            if coarse_step is None:
+                rows = np.arange(0, self.y.size, step)
+                cols = np.arange(0, self.x.size, step)
+                X, Y = np.meshgrid(self.x[cols], self.y[rows])
+                basin, iterations = self._compute_active(X + 1j * Y, progress=False)
+            else:
+                basin, iterations = self._refine(coarse_step, step, basin, iterations,
+                                                 skip='exact' if skip_uniform else None)
+            coarse_step = step
+            self.basin, self.iterations = basin, iterations
+            yield step, basin, iterations
+
+    def compute_adaptive(self, coarse_step: int = 8):
+        """
+        Boundary-only version of compute. A coarse grid is computed first and the stride is halved until
+        it reaches 1. On every level only the cells whose corners disagree in basin are iterated, the flat
+        cells get the basin of their corners and bilinearly interpolated iteration counts.
+        The basin and iterations are stored in self.basin and self.iterations at full resolution.
+        :param coarse_step: int | Stride of the coarsest grid, a power of 2
+        """
+        if coarse_step < 1 or coarse_step & (coarse_step - 1):
+            raise ValueError(f'coarse_step must be a power of 2, got {coarse_step}')
+
+        rows = np.arange(0, self.y.size, coarse_step)
+        cols = np.arange(0, self.x.size, coarse_step)
+        X, Y = np.meshgrid(self.x[cols], self.y[rows])
+        basin, iterations = self._compute_active(X + 1j * Y, progress=False)
+
+        step = coarse_step
+        with tqdm(total=int(np.log2(coarse_step)), desc='Levels') as pbar:
+            while step > 1:
+                basin, iterations = self._refine(step, step // 2, basin, iterations, skip='basin')
+                step //= 2
+                pbar.update()
+        self.basin, self.iterations = basin, iterations
+
+    def _refine(self, coarse_step: int, step: int, coarse_basin, coarse_iterations, skip: str = None):
+        """
+        Compute the grid sampled every step-th pixel from the grid sampled every coarse_step-th pixel.
+        Coarse cell (i, j) spans the samples between corners (i, j) and (i + 1, j + 1).
+        :param coarse_step: int | Stride of the coarse level, a multiple of step
+        :param step: int | Stride of the level to compute
+        :param coarse_basin: int array | Basins of the coarse level
+        :param coarse_iterations: int array | Iterations of the coarse level
+        :param skip: str | Which coarse cells are filled instead of computed. None computes all of them,
+                           'exact' fills cells whose corners agree in basin and iterations,
+                           'basin' fills cells whose corners agree in basin and interpolates the iterations.
+        :return: tuple of arrays (basin, iterations) of the finer level
+        """
+        ratio = coarse_step // step
+        rows = np.arange(0, self.y.size, step)
+        cols = np.arange(0, self.x.size, step)
+        basin = np.zeros((rows.size, cols.size), dtype=int)
+        iterations = np.zeros((rows.size, cols.size), dtype=int)
+
+        # the coarse samples are a subset of the fine ones
+        basin[::ratio, ::ratio] = coarse_basin
+        iterations[::ratio, ::ratio] = coarse_iterations
+        todo = np.ones(basin.shape, dtype=bool)
+        todo[::ratio, ::ratio] = False
+
+        if skip is not None:
+            b, it = coarse_basin, coarse_iterations
+            uniform = b[:-1, :-1] > 0
+            for corner in ((slice(1, None), slice(None, -1)),
+                           (slice(None, -1), slice(1, None)),
+                           (slice(1, None), slice(1, None))):
+                uniform &= b[corner] == b[:-1, :-1]
+                if skip == 'exact':
+                    uniform &= it[corner] == it[:-1, :-1]
+            # cells along the last row and column have no far corners
+            uniform = np.pad(uniform, ((0, 1), (0, 1)), constant_values=False)
+
+            fine_rows, fine_cols = np.nonzero(todo)
+            cell_rows, cell_cols = fine_rows // ratio, fine_cols // ratio
+            fill = uniform[cell_rows, cell_cols]
+            fine_rows, fine_cols = fine_rows[fill], fine_cols[fill]
+            cell_rows, cell_cols = cell_rows[fill], cell_cols[fill]
+
+            basin[fine_rows, fine_cols] = b[cell_rows, cell_cols]
+            if skip == 'exact':
+                iterations[fine_rows, fine_cols] = it[cell_rows, cell_cols]
+            else:
+                u = (fine_rows % ratio) / ratio
+                v = (fine_cols % ratio) / ratio
+                iterations[fine_rows, fine_cols] = np.rint(
+                    (1 - u) * (1 - v) * it[cell_rows, cell_cols] + u * (1 - v) * it[cell_rows + 1, cell_cols]
+                    + (1 - u) * v * it[cell_rows, cell_cols + 1] + u * v * it[cell_rows + 1, cell_cols + 1])
+            todo[fine_rows, fine_cols] = False
+
+        todo_rows, todo_cols = np.nonzero(todo)
+        Z = self.x[cols[todo_cols]] + 1j * self.y[rows[todo_rows]]
+        basin[todo_rows, todo_cols], iterations[todo_rows, todo_cols] = self._compute_active(Z, progress=False)
+        return basin, iterations
+
+    def cache_params(self):
+        """
+        :return: dict with every parameter the basins and iterations depend on
+        """
+        return {'degree': self.degree,
+                'coefficients': None if self.coefficients is None else [[c.real, c.imag] for c in self.coefficients],
+                'x': [float(self.x[0]), float(self.x[-1]), int(self.x.size)],
+                'y': [float(self.y[0]), float(self.y[-1]), int(self.y.size)],
+                'max_basins_iter': self.max_basins_iter,
+                'tolerance': self.tolerance}
+
+    def _tiled_params(self, tile_size: int):
+        """
+        :param tile_size: int | Number of rows and columns in a tile
+        :return: dict of the parameters a tiled render depends on, used to validate a resume
+        """
+        return {**self.cache_params(), 'tile_size': tile_size}
+
+    def _tiles(self, tile_size: int):
+        """
+        Split the grid into blocks, row by row.
+        :param tile_size: int | Number of rows and columns in a tile
+        :return: generator of (row_start, row_stop, col_start, col_stop)
+        """
+        for r0 in range(0, self.y.size, tile_size):
+            for c0 in range(0, self.x.size, tile_size):
+                yield r0, min(r0 + tile_size, self.y.size), c0, min(c0 + tile_size, self.x.size)
+
+    def newton_step(self, z, out, work):
+        """
+        One Newton step z - (z^n - 1) / (n z^(n-1)) without temporaries. z^(n-1) is built once by
+        repeated multiplication and reused for both f and df, every ufunc writes into a buffer.
+        Polynomials given by coefficients evaluate f and df with Horner's scheme instead.
+        :param z: Complex array of current values
+        :param out: Complex array of the same size receiving the next values, must not overlap z
+        :param work: tuple of two complex arrays of the same size used as scratch space
+        :return: out
+        """
+        power, step = work
+        if self.coefficients is not None:
+            horner(self.coefficients, z, out=step)
+            horner(self.derivative_coefficients, z, out=power)
+            np.divide(step, power, out=step)
+            np.subtract(z, step, out=out)
+            return out
+
+        if self.degree == 1:
+            power.fill(1)
+        else:
+            np.copyto(power, z)
+            for _ in range(self.degree - 2):
+                np.multiply(power, z, out=power)  # z^(n-1)
+        np.multiply(power, z, out=step)
+        np.subtract(step, 1, out=step)  # f(z) = z^n - 1
+        np.multiply(power, self.degree, out=power)  # df(z) = n z^(n-1)
+        np.divide(step, power, out=step)
+        np.subtract(z, step, out=out)
+        return out
+
+    def classify(self, z):
+        """
+        Find the root each value has converged to with a single nearest-root lookup.
+        :param z: Complex array of converged values
+        :return: int array with the 1-based index of the nearest root, 0 if no root is within the tolerance
+        """
+        roots = np.asarray(self.roots)
+        distances = np.abs(z[:, None] - roots[None, :])
+        nearest = np.argmin(distances, axis=1)
+        is_root = distances[np.arange(z.size), nearest] < self.tolerance
+        return np.where(is_root, nearest + 1, 0)
+
+    def _compute_active(self, Z, progress: bool = True, observer=None):
+        """
+        Newton iteration over the active set, i.e. the pixels that have not been assigned a basin.
+        The active pixels are kept as compacted arrays of values and flat grid indices which shrink
+        every iteration. Pixels that have settled on a root sit in a region where Newton's method
+        contracts, so they would keep passing the convergence test and can be dropped.
+        All per-pixel arrays are allocated once and the active set lives in their leading part.
+        The optional observer is called after every iteration with a dict of
+            iteration   index of the iteration
+            pixels      number of pixels of the grid
+            active      pixels iterated in this iteration
+            converged   pixels that settled on a root in this iteration
+            no_root     pixels that stopped moving without a root within the tolerance, they stay active
+            remaining   pixels still active after this iteration
+            root_counts int array (degree,) of the pixels that settled on each root in this iteration
+            seconds     wall time of the iteration
+        and pixels still active when it returns True keep basin 0 and iterations 0. Without an observer none
+        of the statistics are computed.
+        :param Z: Complex grid of starting points
+        :param progress: bool | Show a progress bar over the iterations
+        :param observer: callable | Receives the statistics of every iteration, returns True to stop
+        :return: tuple of arrays (basin, iterations) with the shape of Z
+        """
+        basin = np.zeros(Z.shape, dtype=int)
+        iterations = np.zeros(Z.shape, dtype=int)
+        basin_flat = basin.reshape(-1)  # views, writes go to the full-size arrays
+        iterations_flat = iterations.reshape(-1)
+
+        size = Z.size
+        Z_buf = Z.ravel().copy()
+        Z_next_buf = np.empty_like(Z_buf)
+        work = (np.empty_like(Z_buf), np.empty_like(Z_buf))
+        distance_buf = np.empty(size)
+        converged_buf = np.empty(size, dtype=bool)
+        index_buf = np.arange(size)
+        index_next_buf = np.empty_like(index_buf)
+
+        n_active = size
+        for i in tqdm(range(self.max_basins_iter), desc='Iterations', disable=not progress):
+            if observer is not None:
+                start = time.perf_counter()
+            Z = Z_buf[:n_active]
+            Z_next = Z_next_buf[:n_active]
+            index = index_buf[:n_active]
+            converged = converged_buf[:n_active]
+            distance = distance_buf[:n_active]
+            step = work[1][:n_active]
+
+            self.newton_step(Z, Z_next, (work[0][:n_active], step))
+            np.subtract(Z_next, Z, out=step)
+            np.abs(step, out=distance)
+            np.less(distance, self.tolerance, out=converged)  # not changing
+
+            # every active pixel is unassigned, so converged pixels are the newly converged ones
+            converged_index = index[converged]
+            iterations_flat[converged_index] = i
+            basin_converged = self.classify(Z_next[converged])
+            basin_flat[converged_index] = basin_converged
+            settled = basin_converged > 0
+
+            finished = np.all(converged)
+            if not finished:
+                # converged pixels that did not land on a root stay active, like in the dense engine
+                converged[converged] = settled
+                active = np.logical_not(converged, out=converged)
+                n_next = int(np.count_nonzero(active))
+                np.compress(active, Z_next, out=Z_buf[:n_next])
+                np.compress(active, index, out=index_next_buf[:n_next])
+                index_buf, index_next_buf = index_next_buf, index_buf
+
+            if observer is not None:
+                root_counts = np.bincount(basin_converged, minlength=len(self.roots) + 1)
+                stop = observer({'iteration': i,
+                                 'pixels': size,
+                                 'active': n_active,
+                                 'converged': int(root_counts[1:].sum()),
+                                 'no_root': int(root_counts[0]),
+                                 'remaining': 0 if finished else n_next,
+                                 'root_counts': root_counts[1:],
+                                 'seconds': time.perf_counter() - start})
+                if stop:
+                    break
+            if finished:
+                break
+            n_active = n_next
+
+        return basin, iterations
 
     def generate_basins_fig(self, fig_size=(4, 4), dpi=300, cmap='Greys'):
         """
@@ -87,6 +530,8 @@ class Newton_fractals:
         :param cmap: str | colormap for imshow
         :return: fig object
         """
+        import matplotlib.pyplot as plt  # imported on demand, the renderers do not need pyplot
+
         fig = plt.figure(figsize=fig_size, dpi=dpi)
         plt.imshow(self.basin, extent=(self.x[0], self.x[-1], self.y[0], self.y[-1]), cmap=cmap)
         plt.title('Attraction basins')
@@ -100,11 +545,129 @@ class Newton_fractals:
         :param cmap: str | colormap for imshow
         :return: fig object
         """
+        import matplotlib.pyplot as plt
+
         fig = plt.figure(figsize=fig_size, dpi=dpi)
         plt.imshow(self.iterations, extent=(self.x[0], self.x[-1], self.y[0], self.y[-1]), cmap=cmap)
         plt.title('Convergence rate')
         return fig
 
+    def render_basins_image(self, size: tuple = None, cmap='Greys'):
+        """
+        Render the attraction basins straight to an image, without a matplotlib figure.
+        :param size: tuple | (width, height) in pixels, defaults to the resolution of the grid
+        :param cmap: str | colormap, as for generate_basins_fig
+        :return: PIL.Image in RGBA mode
+        """
+        return to_image(apply_colormap(self.basin, cmap=cmap, size=size))
+
+    def render_convergence_rate_image(self, size: tuple = None, cmap='Greys'):
+        """
+        Render the convergence rate straight to an image, without a matplotlib figure.
+        :param size: tuple | (width, height) in pixels, defaults to the resolution of the grid
+        :param cmap: str | colormap, as for generate_convergence_rate_fig
+        :return: PIL.Image in RGBA mode
+        """
+        return to_image(apply_colormap(self.iterations, cmap=cmap, size=size))
+
+
+class ConvergenceRecorder:
+    """
+    Observer of Newton_fractals.compute keeping the statistics of every iteration, e.g. to choose
+    max_basins_iter and tolerance for a poster.
+    """
+
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event: dict):
+        self.events.append(event)
+        return False
+
+    def table(self):
+        """
+        :return: dict of arrays with one entry per iteration, root_counts is an array (iterations, degree)
+        """
+        if not self.events:
+            return {}
+        return {name: np.array([event[name] for event in self.events]) for name in self.events[0]}
+
+    def active_fraction(self):
+        """
+        :return: Array with the fraction of the pixels still active after each iteration
+        """
+        return np.array([event['remaining'] / event['pixels'] for event in self.events])
+
+    def iterations_needed(self, fraction: float = 1e-3):
+        """
+        :param fraction: float | Fraction of the pixels allowed to remain unassigned
+        :return: int, the smallest max_basins_iter leaving at most fraction of the pixels active,
+                 None if the recorded run never got there
+        """
+        below = np.flatnonzero(self.active_fraction() <= fraction)
+        return int(self.events[below[0]]['iteration']) + 1 if below.size else None
+
+
+class ActiveFractionStop:
+    """
+    Observer of Newton_fractals.compute stopping the iteration once few pixels are still active.
+    """
+
+    def __init__(self, fraction: float = 1e-3):
+        """
+        :param fraction: float | Stop when at most this fraction of the pixels is still active
+        """
+        self.fraction = fraction
+
+    def __call__(self, event: dict):
+        return event['remaining'] <= self.fraction * event['pixels']
+
+
+def combine_observers(*observers):
+    """
+    :param observers: callable | Observers of Newton_fractals.compute
+    :return: Observer calling all of them, it stops when any of them does
+    """
+    def observer(event: dict):
+        return any([observe(event) for observe in observers])
+    return observer
+
+
+# state of a worker process in Newton_fractals.compute_parallel
+_tile_worker = {}
+
+
+def _init_tile_worker(nf, basin_name: str, iterations_name: str, shape: tuple):
+    """
+    Attach a worker process to the shared result arrays.
+    :param nf: Newton_fractals | The fractal being computed
+    :param basin_name: str | Name of the shared memory block holding the basins
+    :param iterations_name: str | Name of the shared memory block holding the iterations
+    :param shape: tuple | Shape of the full grid
+    """
+    basin_shm = shared_memory.SharedMemory(name=basin_name)
+    iterations_shm = shared_memory.SharedMemory(name=iterations_name)
+    _tile_worker['nf'] = nf
+    _tile_worker['shm'] = (basin_shm, iterations_shm)  # keep the blocks mapped
+    _tile_worker['basin'] = np.ndarray(shape, dtype=int, buffer=basin_shm.buf)
+    _tile_worker['iterations'] = np.ndarray(shape, dtype=int, buffer=iterations_shm.buf)
+
+
+def _compute_tile_shared(tile: tuple):
+    """
+    Compute one tile in a worker process and write it to the shared result arrays.
+    :param tile: tuple | (row_start, row_stop, col_start, col_stop)
+    :return: dict with the tile bounds, the worker pid and the seconds spent
+    """
+    start = time.perf_counter()
+    r0, r1, c0, c1 = tile
+    nf = _tile_worker['nf']
+    X, Y = np.meshgrid(nf.x[c0:c1], nf.y[r0:r1])
+    basin, iterations = nf._compute_active(X + 1j * Y, progress=False)
+    _tile_worker['basin'][r0:r1, c0:c1] = basin
+    _tile_worker['iterations'][r0:r1, c0:c1] = iterations
+    return {'tile': tile, 'pid': os.getpid(), 'seconds': time.perf_counter() - start}
+
 
 if __name__ == '__main__':
     polynomial_degree = 3
@@ -121,33 +684,12 @@ if __name__ == '__main__':
                          max_basins_iter=max_basins_iter,
                          tolerance=tolerance)
     nf.compute()
-    fig_basins = nf.generate_basins_fig()
-    fig_basins.show()
-
-    # remove all spines for basins figure
-    ax_basins = fig_basins.gca()
-    ax_basins.spines['top'].set_visible(False)
-    ax_basins.spines['bottom'].set_visible(False)
-    ax_basins.spines['right'].set_visible(False)
-    ax_basins.spines['left'].set_visible(False)
-    ax_basins.xaxis.set_visible(False)
-    ax_basins.yaxis.set_visible(False)
-    ax_basins.set_title('')
-    fig_basins.savefig(f'../figures/newton_fractals/basins_poldeg{polynomial_degree}resolution{resolution}.png', format='png')
-
-    dpi = 300
+
+    # images at the exact pixel size, without figure, axes or spines
+    basins_size_pixel = 1200
+    basins_image = nf.render_basins_image(size=(basins_size_pixel, basins_size_pixel))
+    basins_image.save(f'../figures/newton_fractals/basins_poldeg{polynomial_degree}resolution{resolution}.png', format='png')
+
     fig_size_pixel = 1280
-    fig_size = (fig_size_pixel / dpi, fig_size_pixel / dpi)
-    fig_rate = nf.generate_convergence_rate_fig(fig_size=fig_size, dpi=dpi)
-    fig_rate.show()
-
-    # remove all spines for convergence rate figure
-    ax_convrate = fig_rate.gca()
-    ax_convrate.spines['top'].set_visible(False)
-    ax_convrate.spines['bottom'].set_visible(False)
-    ax_convrate.spines['right'].set_visible(False)
-    ax_convrate.spines['left'].set_visible(False)
-    ax_convrate.xaxis.set_visible(False)
-    ax_convrate.yaxis.set_visible(False)
-    ax_convrate.set_title('')
-    fig_rate.savefig(f'../figures/newton_fractals/convrate_poldeg{polynomial_degree}_resolution{resolution}.png', format='png')
+    rate_image = nf.render_convergence_rate_image(size=(fig_size_pixel, fig_size_pixel))
+    rate_image.save(f'../figures/newton_fractals/convrate_poldeg{polynomial_degree}_resolution{resolution}.png', format='png')
@@ -0,0 +1,191 @@
+"""
+Rasterisation shared by the motives.
+Maps result arrays through colormap lookup tables straight into uint8 buffers and hands them to PIL,
+without matplotlib figures or intermediate files.
+"""
+
+import numpy as np
+from PIL import Image
+
+
+def colormap_lut(cmap: str = 'Greys', n: int = 256):
+    """
+    Sample a matplotlib colormap into a lookup table.
+    :param cmap: str | Name of a matplotlib colormap
+    :param n: int | Number of entries
+    :return: uint8 array of shape (n, 4) with RGBA colors
+    """
+    from matplotlib import colormaps  # only the colormap registry is needed, not pyplot
+
+    return colormaps[cmap](np.linspace(0, 1, n), bytes=True)
+
+
+def resample_nearest(values, size: tuple):
+    """
+    Nearest-neighbour resampling of a 2D array to an exact pixel size.
+    :param values: 2D array
+    :param size: tuple | (width, height) in pixels
+    :return: array of shape (height, width), a view if the size already matches
+    """
+    width, height = size
+    if values.shape == (height, width):
+        return values
+    rows = np.arange(height) * values.shape[0] // height
+    cols = np.arange(width) * values.shape[1] // width
+    return values[rows[:, None], cols[None, :]]
+
+
+def apply_colormap(values, cmap: str = 'Greys', size: tuple = None, vmin=None, vmax=None, chunk_rows: int = 1024):
+    """
+    Map a 2D array through a colormap into an RGBA buffer, normalised linearly between vmin and vmax
+    like plt.imshow. Integer arrays are mapped through a per-value table, so each pixel is a single lookup.
+    :param values: 2D array, e.g. basins or iterations
+    :param cmap: str | Name of a matplotlib colormap
+    :param size: tuple | (width, height) of the output in pixels, defaults to the shape of values
+    :param vmin: Value mapped to the first color, defaults to the minimum of values
+    :param vmax: Value mapped to the last color, defaults to the maximum of values
+    :param chunk_rows: int | Rows mapped at a time, bounds the temporary memory
+    :return: uint8 array of shape (height, width, 4)
+    """
+    if size is not None:
+        values = resample_nearest(values, size)
+    vmin = values.min() if vmin is None else vmin
+    vmax = values.max() if vmax is None else vmax
+    lut = colormap_lut(cmap)
+    n = len(lut)
+    scale = n / (vmax - vmin) if vmax > vmin else 0
+
+    integer = np.issubdtype(values.dtype, np.integer) and vmax - vmin < 2 ** 16
+    if integer:
+        levels = np.arange(int(vmin), int(vmax) + 1)
+        value_lut = lut[np.clip(((levels - vmin) * scale).astype(int), 0, n - 1)]
+
+    rgba = np.empty(values.shape + (4,), dtype=np.uint8)
+    for r0 in range(0, values.shape[0], chunk_rows):
+        chunk = values[r0:r0 + chunk_rows]
+        if integer:
+            np.take(value_lut, np.clip(chunk, vmin, vmax) - int(vmin), axis=0, out=rgba[r0:r0 + chunk_rows])
+        else:
+            index = np.clip(((chunk - vmin) * scale).astype(int), 0, n - 1)
+            np.take(lut, index, axis=0, out=rgba[r0:r0 + chunk_rows])
+    return rgba
+
+
+def to_image(buffer):
+    """
+    Wrap a uint8 buffer in a PIL image without copying.
+    :param buffer: uint8 array of shape (height, width, 4) for RGBA or (height, width) for grayscale
+    :return: PIL.Image sharing memory with buffer
+    """
+    buffer = np.ascontiguousarray(buffer, dtype=np.uint8)
+    height, width = buffer.shape[:2]
+    mode = 'RGBA' if buffer.ndim == 3 else 'L'
+    return Image.frombuffer(mode, (width, height), buffer, 'raw', mode, 0, 1)
+
+
+def accumulate_density(counts, points, bounds: tuple):
+    """
+    Bin points into a 2D count image, in place. Row 0 of the image is the top, i.e. the largest y.
+    Points outside the bounds are dropped.
+    :param counts: Integer array (height, width) | Accumulated counts, C-contiguous
+    :param points: Array (n, 2) | x- and y-coordinates
+    :param bounds: tuple | (xmin, xmax, ymin, ymax) covered by the image
+    :return: counts
+    """
+    height, width = counts.shape
+    xmin, xmax, ymin, ymax = bounds
+    x, y = points[:, 0], points[:, 1]
+    inside = (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)
+    x, y = x[inside], y[inside]
+
+    cols = np.minimum(((x - xmin) * (width / (xmax - xmin))).astype(np.intp), width - 1)
+    rows = np.minimum(((ymax - y) * (height / (ymax - ymin))).astype(np.intp), height - 1)
+    index = rows * width + cols
+
+    flat = counts.reshape(-1)
+    if 4 * index.size >= flat.size:
+        flat += np.bincount(index, minlength=flat.size).astype(counts.dtype, copy=False)
+    else:
+        # few points per pixel, avoid touching the whole image
+        pixels, pixel_counts = np.unique(index, return_counts=True)
+        flat[pixels] += pixel_counts.astype(counts.dtype, copy=False)
+    return counts
+
+
+def tone_map(density, method: str = 'log', gamma: float = 0.5, invert: bool = True):
+    """
+    Compress a density image into 8 bits so faint and dense regions are both visible.
+    :param density: 2D array of counts or accumulated weights
+    :param method: str | 'log' maps log(1 + d), 'gamma' maps d^gamma, both normalised by the maximum
+    :param gamma: float | Exponent of the 'gamma' method
+    :param invert: bool | Dark marks on white paper instead of bright marks on black
+    :return: uint8 array with the shape of density
+    """
+    peak = float(density.max())
+    if peak <= 0:
+        values = np.zeros(density.shape)
+    elif method == 'log':
+        values = np.log1p(density) / np.log1p(peak)
+    elif method == 'gamma':
+        values = (density / peak) ** gamma
+    else:
+        raise ValueError(f'Unknown tone mapping {method!r}, expected "log" or "gamma"')
+
+    image = np.rint(values * 255).astype(np.uint8)
+    if invert:
+        np.subtract(255, image, out=image)
+    return image
+
+
+def draw_segments(buffer, x0, y0, x1, y1, bounds: tuple, weight=1.0, max_samples: int = 2 ** 24):
+    """
+    Add anti-aliased line segments to a float accumulation image, in place. Every segment is sampled at the
+    midpoints of about one pixel long pieces and each sample is split bilinearly over its four nearest pixels, so
+    overlapping segments add up instead of saturating. All segments are processed together in batches.
+    :param buffer: Float array (height, width) | The accumulation image, row 0 is the largest y
+    :param x0: Array (n,) | x-coordinates of the segment starts
+    :param y0: Array (n,) | y-coordinates of the segment starts
+    :param x1: Array (n,) | x-coordinates of the segment ends
+    :param y1: Array (n,) | y-coordinates of the segment ends
+    :param bounds: tuple | (xmin, xmax, ymin, ymax) covered by the image
+    :param weight: float or array (n,) | Ink deposited per pixel of segment length, e.g. the multiplicity
+                                         of segments that occur several times
+    :param max_samples: int | Number of samples processed at a time, bounds the temporary memory
+    :return: buffer
+    """
+    height, width = buffer.shape
+    xmin, xmax, ymin, ymax = bounds
+    sx, sy = width / (xmax - xmin), height / (ymax - ymin)
+
+    # pixel coordinates, pixel (i, j) covers [j, j + 1) x [i, i + 1)
+    px0, px1 = (np.asarray(x0, dtype=float) - xmin) * sx, (np.asarray(x1, dtype=float) - xmin) * sx
+    py0, py1 = (ymax - np.asarray(y0, dtype=float)) * sy, (ymax - np.asarray(y1, dtype=float)) * sy
+    lengths = np.hypot(px1 - px0, py1 - py0)
+    weight = np.broadcast_to(np.asarray(weight, dtype=float), lengths.shape)
+    n_samples = np.maximum(np.ceil(lengths).astype(np.intp), 1)
+
+    flat = buffer.reshape(-1)
+    ends = np.cumsum(n_samples)
+    first = 0
+    while first < len(n_samples):
+        # the segments whose samples fit in this batch, at least one
+        base = ends[first - 1] if first else 0
+        last = max(int(np.searchsorted(ends, base + max_samples, side='right')), first + 1)
+        segments = np.repeat(np.arange(first, last), n_samples[first:last])
+        offsets = np.arange(base, base + len(segments)) - np.repeat(ends[first:last] - n_samples[first:last],
+                                                                     n_samples[first:last])
+        t = (offsets + 0.5) / n_samples[segments]
+
+        x = px0[segments] + t * (px1[segments] - px0[segments]) - 0.5
+        y = py0[segments] + t * (py1[segments] - py0[segments]) - 0.5
+        sample_weight = weight[segments] * lengths[segments] / n_samples[segments]
+
+        ix, iy = np.floor(x).astype(np.intp), np.floor(y).astype(np.intp)
+        ax, ay = x - ix, y - iy
+        for dx, dy, w in ((0, 0, (1 - ax) * (1 - ay)), (1, 0, ax * (1 - ay)), (0, 1, (1 - ax) * ay), (1, 1, ax * ay)):
+            cols, rows = ix + dx, iy + dy
+            inside = (cols >= 0) & (cols < width) & (rows >= 0) & (rows < height)
+            flat += np.bincount(rows[inside] * width + cols[inside], weights=(w * sample_weight)[inside],
+                                minlength=flat.size)
+        first = last
+    return buffer
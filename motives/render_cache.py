@@ -0,0 +1,172 @@
+"""
+Content-addressed cache of render results shared by all motives and the poster builder.
+A result is stored as a compressed .npz file named after a hash of the kind of result, its parameters and the
+source code of the modules that produce it, so changing a parameter or the code never returns a stale result.
+The least recently used files are deleted once the cache grows beyond its disk budget.
+
+The cache directory and budget are read from the environment:
+    MATHART_CACHE_DIR       directory of the cache, defaults to cache/renders in the repository
+    MATHART_CACHE_BUDGET    disk budget in megabytes, defaults to 4096, 0 disables the cache
+"""
+
+import functools
+import hashlib
+import json
+import os
+import zipfile
+import zlib
+
+import numpy as np
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cache', 'renders')
+CACHE_BUDGET_MB = 4096
+
+
+@functools.lru_cache(maxsize=None)
+def code_version(*sources: str):
+    """
+    :param sources: str | Source files whose code determines a result
+    :return: str with a hash of the contents of the files
+    """
+    digest = hashlib.sha256()
+    for source in sources:
+        with open(source, 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def _jsonable(value):
+    """
+    json.dumps fallback for the parameter types of the motives.
+    """
+    if isinstance(value, complex):
+        return [value.real, value.imag]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, type):
+        return value.__name__
+    if isinstance(value, np.dtype):
+        return value.name
+    raise TypeError(f'Cannot use {value!r} of type {type(value).__name__} in a cache key')
+
+
+def cache_key(kind: str, params: dict, sources: tuple = ()):
+    """
+    :param kind: str | Name of the result, e.g. the class and method producing it
+    :param params: dict | Everything the result depends on, made of JSON types, tuples, complex and numpy values
+    :param sources: tuple | Source files of the code producing the result
+    :return: str with the hex digest identifying the result
+    """
+    text = json.dumps({'kind': kind, 'params': params, 'code': code_version(*sources)}, sort_keys=True,
+                      default=_jsonable)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class RenderCache:
+
+    def __init__(self, directory: str = None, budget_mb: float = None):
+        """
+        :param directory: str | Directory of the cache, defaults to MATHART_CACHE_DIR or CACHE_DIR
+        :param budget_mb: float | Disk budget in megabytes, defaults to MATHART_CACHE_BUDGET or CACHE_BUDGET_MB.
+                                  A budget of 0 disables the cache.
+        """
+        self.directory = directory or os.environ.get('MATHART_CACHE_DIR') or CACHE_DIR
+        if budget_mb is None:
+            budget_mb = float(os.environ.get('MATHART_CACHE_BUDGET', CACHE_BUDGET_MB))
+        self.budget = int(budget_mb * 2 ** 20)
+
+    @property
+    def enabled(self):
+        return self.budget > 0
+
+    def path(self, key: str):
+        return os.path.join(self.directory, key + '.npz')
+
+    def load(self, key: str):
+        """
+        :param key: str | Key from cache_key
+        :return: dict of arrays, or None when the result is not cached
+        """
+        if not self.enabled:
+            return None
+        path = self.path(key)
+        try:
+            with np.load(path) as saved:
+                arrays = {name: saved[name] for name in saved.files}
+        except FileNotFoundError:
+            return None  # missing or evicted meanwhile
+        except (ValueError, OSError, EOFError, zipfile.BadZipFile, zlib.error):
+            try:
+                os.remove(path)  # a broken file, rendered again and replaced by the caller
+            except OSError:
+                pass
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            pass  # evicted by another process meanwhile, the arrays are loaded already
+        return arrays
+
+    def save(self, key: str, **arrays):
+        """
+        Store arrays under key and evict the least recently used results beyond the budget.
+        The file is written atomically, concurrent renders of the same result do not corrupt it.
+        :param key: str | Key from cache_key
+        :param arrays: Arrays of the result
+        """
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key)
+        temporary = f'{path}.{os.getpid()}.tmp'
+        try:
+            with open(temporary, 'wb') as file:
+                np.savez_compressed(file, **arrays)
+            os.replace(temporary, path)
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)  # interrupted before the replace
+        self.evict()
+
+    def evict(self):
+        """
+        Delete the least recently used results until the cache fits in the budget.
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npz'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue  # evicted by another process meanwhile
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.budget:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        """
+        Delete every cached result.
+        """
+        if os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.npz'):
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+
+
+def default_cache():
+    """
+    :return: RenderCache configured by the environment, read again on every call
+    """
+    return RenderCache()
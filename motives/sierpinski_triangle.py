@@ -1,10 +1,25 @@
 # %% imports
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 import random
-import matplotlib.pyplot as plt
 from tqdm import tqdm
 import decimal as dec
-import plotly.graph_objects as go
+
+try:
+    from motives.ifs import IFS
+    from motives.raster import accumulate_density, tone_map, to_image
+    from motives.render_cache import cache_key, default_cache
+except ModuleNotFoundError:  # run as a script from within motives/
+    from ifs import IFS
+    from raster import accumulate_density, tone_map, to_image
+    from render_cache import cache_key, default_cache
+
+# the code density images depend on, part of their render cache keys
+CACHE_SOURCES = (__file__, sys.modules[accumulate_density.__module__].__file__)
 
 
 # %% point class
@@ -50,19 +65,62 @@ class Point:
             self.__y = y
 
 
+# %% vectorised chaos game
+
+def midpoint_chain(start, targets, out, block: int = 64, carry_terms: int = 3):
+    """
+    Compute the chaos game recurrence x_t = (x_(t-1) + c_t) / 2 for a whole batch of targets at once.
+    Within a block of B steps, x_t = (q + S_t) / 2^t where q is the point before the block and
+    S_t = sum_(j <= t) c_j 2^(j-1) is a cumulative sum, so no Python work is done per point.
+    The point before a block only contributes with weight 2^-B to the next block, so it is
+    assembled from the last carry_terms block sums, which is exact to far below float64 precision.
+    :param start: Array (2,) | The current point
+    :param targets: Array (m, 2) | The corner moved towards in each step
+    :param out: Array (m, 2) | Receives the points, float64 or float32
+    :param block: int | Steps per block, 2^block has to stay far below the float64 range
+    :param carry_terms: int | Number of preceding blocks carried into a block
+    :return: Array (2,) with the last point in float64
+    """
+    m = len(targets)
+    n_blocks = -(-m // block)
+    padded = np.zeros((n_blocks * block, 2))
+    padded[:m] = targets
+    padded = padded.reshape(n_blocks, block, 2)
+
+    exponents = np.arange(block)
+    partial_sums = np.cumsum(padded * np.exp2(exponents)[None, :, None], axis=1)  # S_t
+    block_ends = partial_sums[:, -1] * np.exp2(-block)  # last point of each block without its carry
+
+    carry = np.zeros((n_blocks, 2))
+    decay = 1.0
+    for lag in range(1, carry_terms + 1):
+        carry[lag:] += decay * block_ends[:n_blocks - lag]
+        decay *= np.exp2(-block)
+    first_blocks = min(n_blocks, carry_terms + 1)
+    carry[:first_blocks] += np.asarray(start, dtype=float)[None, :] * np.exp2(-block * np.arange(first_blocks))[:, None]
+
+    points = (carry[:, None, :] + partial_sums) * np.exp2(-(exponents + 1))[None, :, None]
+    points = points.reshape(-1, 2)[:m]
+    out[:] = points
+    return points[-1].copy()
+
+
 # %% siepinski class
 
 class Sierpinski:
 
-    def __init__(self, corner1: Point, corner2: Point, corner3: Point):
+    def __init__(self, corner1: Point, corner2: Point, corner3: Point, seed: int = None):
         self.current_point = None
         self.__corner1 = corner1
         self.__corner2 = corner2
         self.__corner3 = corner3
+        self.__corners = np.array([corner1.coordinates, corner2.coordinates, corner3.coordinates], dtype=float)
         self.__iter = -1
         self.__middle_point = None
         self.__test_point = None
-        self.__added_points = []
+        self.__added_points = np.empty((0, 2))
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
 
     @property
     def corner1(self):
@@ -78,6 +136,7 @@ class Sierpinski:
 
     @property
     def added_points(self):
+        """Array (n, 2) with the x- and y-coordinates of the generated points"""
         return self.__added_points
 
     def get_points(self):
@@ -85,8 +144,8 @@ class Sierpinski:
 
     def __area(self, leave_out_point=0):
         x1, y1 = self.__corner1.coordinates
-        x2, y2 = self.__corner1.coordinates
-        x3, y3 = self.__corner1.coordinates
+        x2, y2 = self.__corner2.coordinates
+        x3, y3 = self.__corner3.coordinates
         if leave_out_point == 1:
             x1, y1 = self.__test_point.coordinates
         elif leave_out_point == 2:
@@ -95,12 +154,65 @@ class Sierpinski:
             x3, y3 = self.__test_point.coordinates
         return abs((x1 * (y2 - y3) + x2 * (y3 - y1) + x3 * (y1 - y2)) / 2.0)
 
-    def is_inside_triangle(self):
+    def is_inside_triangle(self, point: Point = None):
+        """
+        Area test for a single point, see contains for arrays of points.
+        :param point: Point | The point to test, defaults to the last tested point
+        :return: bool
+        """
+        if point is not None:
+            self.__test_point = point
         A = self.__area(leave_out_point=0)
         A1 = self.__area(leave_out_point=1)
         A2 = self.__area(leave_out_point=2)
         A3 = self.__area(leave_out_point=3)
-        return A == A1 + A2 + A3
+        return bool(np.isclose(A, A1 + A2 + A3))
+
+    def __barycentric_coefficients(self):
+        """
+        Coefficients of the barycentric coordinates as affine functions of x and y.
+        :return: Array (3, 3) where row i holds (a, b, c) with lambda_i = a x + b y + c
+        """
+        (x1, y1), (x2, y2), (x3, y3) = self.__corners
+        det = (y2 - y3) * (x1 - x3) + (x3 - x2) * (y1 - y3)
+        a1, b1 = (y2 - y3) / det, (x3 - x2) / det
+        a2, b2 = (y3 - y1) / det, (x1 - x3) / det
+        c1 = -(a1 * x3 + b1 * y3)
+        c2 = -(a2 * x3 + b2 * y3)
+        return np.array([[a1, b1, c1],
+                         [a2, b2, c2],
+                         [-a1 - a2, -b1 - b2, 1 - c1 - c2]])
+
+    def contains(self, points, tol: float = 1e-12, chunk_size: int = 2 ** 22):
+        """
+        Batched point-in-triangle test with barycentric coordinates.
+        :param points: Array (n, 2) | x- and y-coordinates
+        :param tol: float | Points whose barycentric coordinates are all >= -tol count as inside,
+                            so points on the edges are included despite rounding
+        :param chunk_size: int | Number of points tested at a time, bounds the temporary memory
+        :return: bool array (n,)
+        """
+        coefficients = self.__barycentric_coefficients()
+        inside = np.empty(len(points), dtype=bool)
+        for start in range(0, len(points), chunk_size):
+            chunk = points[start:start + chunk_size]
+            barycentric = chunk @ coefficients[:, :2].T + coefficients[:, 2]
+            np.all(barycentric >= -tol, axis=1, out=inside[start:start + chunk_size])
+        return inside
+
+    def clip(self, points, bounds: tuple = None, tol: float = 1e-12):
+        """
+        Keep the points inside the triangle and, for a framing crop, inside bounds.
+        :param points: Array (n, 2) | x- and y-coordinates
+        :param bounds: tuple | (xmin, xmax, ymin, ymax) of the crop
+        :param tol: float | Tolerance of the triangle test, see contains
+        :return: Array (m, 2) with the kept points
+        """
+        keep = self.contains(points, tol=tol)
+        if bounds is not None:
+            xmin, xmax, ymin, ymax = bounds
+            keep &= (points[:, 0] >= xmin) & (points[:, 0] <= xmax) & (points[:, 1] >= ymin) & (points[:, 1] <= ymax)
+        return points[keep]
 
     # choose random corner point
     def random_corner(self):
@@ -145,23 +257,211 @@ class Sierpinski:
         # go to the next point
         self.current_point = Point(new_x, new_y)
 
-    def algorithm(self, n: int):
+    def algorithm(self, n: int, dtype=np.float64, chunk_size: int = 2 ** 20):
         """
-        The algorithm creating the Sierpinsky triangle
+        The algorithm creating the Sierpinsky triangle.
+        The points are generated in batches by stream and copied into a preallocated array,
+        which is appended to added_points.
         :param n: Number of iterations
+        :param dtype: float64 or float32 | Type of the stored points
+        :param chunk_size: int | Number of points generated per batch, bounds the temporary memory
         :return:
         """
+        n_previous = len(self.__added_points)
+        points = np.empty((n_previous + n, 2), dtype=dtype)
+        points[:n_previous] = self.__added_points
+        stop = n_previous
+        for chunk in tqdm(self.stream(n, chunk_size=chunk_size, dtype=dtype), total=-(-n // chunk_size)):
+            points[stop:stop + len(chunk)] = chunk
+            stop += len(chunk)
+
+        self.__added_points = points
+
+    def stream(self, n: int, chunk_size: int = 2 ** 20, dtype=np.float64, start=None):
+        """
+        Generate the points of the chaos game in fixed-size chunks without storing them.
+        The chunk is a reused buffer, so it is only valid until the next one is requested.
+        current_point follows the last point of the latest chunk.
+        :param n: Number of iterations
+        :param chunk_size: int | Number of points per chunk
+        :param dtype: float64 or float32 | Type of the points
+        :param start: Array (2,) | Point to continue from, defaults to a random corner
+        :return: generator of arrays (m, 2) with m <= chunk_size
+        """
         # choose starting corner
-        self.rule1()
+        current = self.__corners[self.rng.integers(3)] if start is None else np.asarray(start, dtype=float)
+
+        buffer = np.empty((min(chunk_size, n), 2), dtype=dtype)
+        for chunk_start in range(0, n, chunk_size):
+            chunk = buffer[:min(chunk_size, n - chunk_start)]
+            choices = self.rng.integers(3, size=len(chunk))
+            current = midpoint_chain(current, self.__corners[choices], out=chunk)
+            self.current_point = Point(float(current[0]), float(current[1]))
+            yield chunk
+
+    def accumulate(self, n: int, width_px: int, height_px: int, bounds: tuple = None, chunk_size: int = 2 ** 22,
+                   checkpoint: str = None, checkpoint_every: int = 16, progress: bool = True, cache: bool = True):
+        """
+        Stream n points straight into a density image, so memory does not grow with n.
+        With a checkpoint file, the RNG state, the last point and the partial image are saved every
+        checkpoint_every chunks, and a later call with the same arguments continues from there.
+        A seeded triangle consults the render cache, keyed by the state of the generator, so it reuses the image
+        of an earlier run and leaves the generator and current_point as that run did. Unseeded runs are not
+        cached, they would never be reused.
+        :param n: Number of iterations
+        :param width_px: int | Width of the image in pixels
+        :param height_px: int | Height of the image in pixels
+        :param bounds: tuple | (xmin, xmax, ymin, ymax) covered by the image, defaults to the triangle
+        :param chunk_size: int | Number of points generated and binned at a time
+        :param checkpoint: str | Path of an .npz checkpoint file
+        :param checkpoint_every: int | Number of chunks between checkpoints
+        :param progress: bool | Show a progress bar
+        :param cache: bool | Consult and fill the render cache, only used when the triangle has a seed
+        :return: int64 array (height_px, width_px) with the number of points per pixel
+        """
+        bounds = self.bounds() if bounds is None else tuple(float(b) for b in bounds)
+
+        render_cache = default_cache() if cache and self.seed is not None else None
+        key = cache_key('Sierpinski.accumulate',
+                        {'corners': self.__corners, 'n': n, 'size': (width_px, height_px), 'bounds': bounds,
+                         'chunk_size': chunk_size, 'rng_state': self.rng.bit_generator.state}, CACHE_SOURCES)
+        cached = render_cache.load(key) if render_cache is not None else None
+        if cached is not None:
+            self.rng.bit_generator.state = json.loads(str(cached['rng_state']))
+            self.current_point = Point(*(float(c) for c in cached['current']))
+            return cached['counts']
+
+        counts = np.zeros((height_px, width_px), dtype=np.int64)
+        done = 0
+        start = None
+
+        if checkpoint is not None and os.path.exists(checkpoint):
+            with np.load(checkpoint) as saved:
+                if int(saved['n']) != n or tuple(saved['bounds']) != bounds or saved['counts'].shape != counts.shape:
+                    raise ValueError(f'Checkpoint {checkpoint} belongs to another render')
+                counts[:] = saved['counts']
+                done = int(saved['done'])
+                start = saved['current']
+                self.current_point = Point(*(float(c) for c in start))
+                self.rng.bit_generator.state = json.loads(str(saved['rng_state']))
+            render_cache = None  # the checkpoint may come from another generator, do not file it under this key
+
+        with tqdm(total=n, initial=done, unit='points', disable=not progress) as pbar:
+            for i, chunk in enumerate(self.stream(n - done, chunk_size=chunk_size, start=start), start=1):
+                accumulate_density(counts, chunk, bounds)
+                done += len(chunk)
+                pbar.update(len(chunk))
+                if checkpoint is not None and (i % checkpoint_every == 0 or done == n):
+                    self._save_checkpoint(checkpoint, counts, n, done, bounds)
+
+        if render_cache is not None and self.current_point is not None:  # None when no point was ever played
+            render_cache.save(key, counts=counts, current=np.array(self.current_point.coordinates),
+                              rng_state=json.dumps(self.rng.bit_generator.state))
+        return counts
+
+    def parallel_density(self, n: int, width_px: int, height_px: int, workers: int = None, seed: int = None,
+                         bounds: tuple = None, chunk_size: int = 2 ** 22, cache: bool = True):
+        """
+        Run the chaos game in several processes and sum their density images. Every worker plays its own
+        game with n / workers points and a generator derived from np.random.SeedSequence(seed), so the
+        result only depends on seed and workers.
+        :param n: Number of iterations in total
+        :param width_px: int | Width of the image in pixels
+        :param height_px: int | Height of the image in pixels
+        :param workers: int | Number of worker processes, defaults to the number of cores
+        :param seed: int | Seed of the SeedSequence the worker generators are spawned from
+        :param bounds: tuple | (xmin, xmax, ymin, ymax) covered by the image, defaults to the triangle
+        :param chunk_size: int | Number of points generated and binned at a time by each worker
+        :param cache: bool | Consult and fill the render cache, only used with a seed
+        :return: int64 array (height_px, width_px) with the number of points per pixel
+        """
+        workers = os.cpu_count() if workers is None else workers
+        bounds = self.bounds() if bounds is None else tuple(float(b) for b in bounds)
+
+        render_cache = default_cache() if cache and seed is not None else None
+        key = cache_key('Sierpinski.parallel_density',
+                        {'corners': self.__corners, 'n': n, 'size': (width_px, height_px), 'bounds': bounds,
+                         'chunk_size': chunk_size, 'workers': workers, 'seed': seed}, CACHE_SOURCES)
+        cached = render_cache.load(key) if render_cache is not None else None
+        if cached is not None:
+            return cached['counts']
+        seeds = np.random.SeedSequence(seed).spawn(workers)
+        points_per_worker = [n // workers + (i < n % workers) for i in range(workers)]
+        corners = [corner.coordinates for corner in self.get_points()]
+
+        counts = np.zeros((height_px, width_px), dtype=np.int64)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_density_worker, corners, n_worker, width_px, height_px, bounds, worker_seed,
+                                   chunk_size)
+                       for n_worker, worker_seed in zip(points_per_worker, seeds)]
+            for future in tqdm(futures, desc='Workers'):
+                counts += future.result()
+
+        if render_cache is not None:
+            render_cache.save(key, counts=counts)
+        return counts
+
+    def _save_checkpoint(self, path: str, counts, n: int, done: int, bounds: tuple):
+        """
+        Write the state of accumulate atomically, an interrupted write leaves the previous checkpoint intact.
+        """
+        with open(path + '.tmp', 'wb') as fp:
+            np.savez(fp, counts=counts, n=n, done=done, bounds=bounds,
+                     current=np.array(self.current_point.coordinates),
+                     rng_state=json.dumps(self.rng.bit_generator.state))
+        os.replace(path + '.tmp', path)
 
-        for _ in tqdm(range(n)):
-            # find next point
-            self.rule2()
+    def as_ifs(self, seed=None):
+        """
+        The triangle as a preset of the general iterated function system engine.
+        :param seed: int | Seed for the generator of the IFS
+        :return: IFS moving halfway to a random corner
+        """
+        return IFS.sierpinski(self.__corners, seed=seed)
 
-            # add the middle point
-            self.added_points.append(self.current_point)
+    def bounds(self):
+        """
+        :return: tuple (xmin, xmax, ymin, ymax) enclosing the triangle
+        """
+        (xmin, ymin), (xmax, ymax) = self.__corners.min(axis=0), self.__corners.max(axis=0)
+        return float(xmin), float(xmax), float(ymin), float(ymax)
+
+    def density(self, width_px: int, height_px: int, bounds: tuple = None, chunk_size: int = 2 ** 22):
+        """
+        Bin the added points into a count image of the target pixel size.
+        :param width_px: int | Width of the image in pixels
+        :param height_px: int | Height of the image in pixels
+        :param bounds: tuple | (xmin, xmax, ymin, ymax) covered by the image, defaults to the triangle
+        :param chunk_size: int | Number of points binned at a time
+        :return: int64 array (height_px, width_px) with the number of points per pixel
+        """
+        bounds = self.bounds() if bounds is None else bounds
+        counts = np.zeros((height_px, width_px), dtype=np.int64)
+        for start in range(0, len(self.added_points), chunk_size):
+            accumulate_density(counts, self.added_points[start:start + chunk_size], bounds)
+        return counts
+
+    def rasterise_points(self, width_px: int, height_px: int, method: str = 'log', gamma: float = 0.5,
+                         bounds: tuple = None):
+        """
+        Render the added points as a tone-mapped density image, the cost depends on the pixel count
+        rather than the number of points.
+        :param width_px: int | Width of the image in pixels
+        :param height_px: int | Height of the image in pixels
+        :param method: str | Tone mapping, 'log' or 'gamma'
+        :param gamma: float | Exponent of the 'gamma' tone mapping
+        :param bounds: tuple | (xmin, xmax, ymin, ymax) covered by the image, defaults to the triangle
+        :return: uint8 array (height_px, width_px), dark points on white, ready for raster.to_image
+        """
+        return tone_map(self.density(width_px, height_px, bounds=bounds), method=method, gamma=gamma)
 
     def plot_points(self, plot_type: str, dpi: int, figure_width_inch: float, figure_height_inch: float):
+        # plotting libraries are imported on demand, the density renderers do not need them
+        if plot_type == 'plt':
+            import matplotlib.pyplot as plt
+        elif plot_type == 'go':
+            import plotly.graph_objects as go
+
         if plot_type == 'plt':
             fig = plt.figure(figsize=(figure_width_inch, figure_height_inch), dpi=dpi)
         elif plot_type == 'go':
@@ -179,17 +479,29 @@ class Sierpinski:
 
         # plot the added points
         if plot_type == 'plt':
-            plt.scatter(x=[p.x for p in self.added_points], y=[p.y for p in self.added_points], c='k', s=0.001)
+            plt.scatter(x=self.added_points[:, 0], y=self.added_points[:, 1], c='k', s=0.001)
             plt.title(f'Sierpinsky Triangle after {len(self.added_points)} iterations')
             plt.show()
         elif plot_type == 'go':
-            fig.add_trace(go.Scatter(x=[p.x for p in self.added_points], y=[p.y for p in self.added_points], mode='markers',marker=dict(size=2, color='black')))
-            fig.update_layout(title=f'Sierpinsky Triangle after {self.added_points} iterations',
+            fig.add_trace(go.Scatter(x=self.added_points[:, 0], y=self.added_points[:, 1], mode='markers',marker=dict(size=2, color='black')))
+            fig.update_layout(title=f'Sierpinsky Triangle after {len(self.added_points)} iterations',
                               xaxis_title='X Axis',
                               yaxis_title='Y Axis')
             fig.show()
         return fig
 
+def _density_worker(corners: list, n: int, width_px: int, height_px: int, bounds: tuple, seed, chunk_size: int):
+    """
+    Density image of one worker in Sierpinski.parallel_density.
+    :param corners: list of (x, y) | The corners of the triangle
+    :param seed: np.random.SeedSequence | Seed of the worker's generator
+    :return: int64 array (height_px, width_px)
+    """
+    sierpinski = Sierpinski(*(Point(x, y) for x, y in corners), seed=seed)
+    return sierpinski.accumulate(n, width_px, height_px, bounds=bounds, chunk_size=chunk_size, progress=False,
+                                 cache=False)
+
+
 # %% main
 
 if __name__ == '__main__':
@@ -198,7 +510,7 @@ if __name__ == '__main__':
     p2 = Point(2, np.sqrt(3))
     p3 = Point(3, 1)
     st = Sierpinski(p1, p2, p3)
-    st.algorithm(n=int(1e3))
+    st.algorithm(n=int(1e7))
 
     # Figure size,
     poster_width = 80  # cm
@@ -211,16 +523,7 @@ if __name__ == '__main__':
     fig_height = poster_height_inch / 6
 
 
-    fig = st.plot_points(plot_type='plt', dpi=300, figure_width_inch=6.4, figure_height_inch=4.8)
-
-    # remove all spines
-    ax = fig.gca()
-    ax.spines['top'].set_visible(False)
-    ax.spines['bottom'].set_visible(False)
-    ax.spines['right'].set_visible(False)
-    ax.spines['left'].set_visible(False)
-    ax.xaxis.set_visible(False)
-    ax.yaxis.set_visible(False)
-    ax.set_title('')
-    fig.savefig('triangle_manySmallPoints.png', format='png')
-
+    # density image at the figure size, instead of scattering every point
+    dpi = 300
+    image = st.rasterise_points(width_px=int(fig_width * dpi), height_px=int(fig_height * dpi))
+    to_image(image).save('triangle_manySmallPoints.png', format='png')